@@ -0,0 +1,296 @@
+"""
+Benchmarks for the social image rendering pipeline.
+
+Generates a synthetic template, avatars and session data, then measures images
+per second, latency and peak memory for single renders, batch renders and
+thumbnail generation using the bundled Lato fonts. Only the public rendering
+methods are timed so the same script runs against older versions of the package;
+per stage latency and cache stats come from the metrics summary of versions that
+collect it. Results are printed and can be written as JSON and compared against
+an earlier run:
+
+    python benchmarks/render.py --output before.json
+    python benchmarks/render.py --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent import futures
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+import PIL
+from PIL import Image
+from PIL import ImageDraw
+import social_image_generator
+from social_image_generator import SocialImageGenerator
+
+
+ASSETS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "assets"))
+WORDS = ("arm linux kernel performance security cloud edge boot firmware toolchain "
+         "compiler testing open source upstream virtualization containers energy").split()
+
+# Static layout matching examples/sched.py with the session values as slots
+LAYOUT = {
+    "elements": {
+        "images": [
+            {"dimensions": {"x": 300, "y": 300}, "position": {"x": 820, "y": 80},
+             "slot": "speaker_image", "circle": "True"}
+        ],
+        "text": [
+            {"multiline": "True", "centered": "True", "wrap_width": 28, "slot": "speakers",
+             "position": {"x": [920, 970], "y": 400},
+             "font": {"size": 32, "family": "fonts/Lato-Regular.ttf", "colour": {"r": 255, "g": 255, "b": 255}}},
+            {"multiline": "False", "centered": "False", "wrap_width": 28, "slot": "session_id",
+             "position": {"x": 80, "y": 340},
+             "font": {"size": 48, "family": "fonts/Lato-Bold.ttf", "colour": {"r": 255, "g": 255, "b": 255}}},
+            {"multiline": "False", "centered": "False", "wrap_width": 28, "slot": "event_type",
+             "position": {"x": 80, "y": 400},
+             "font": {"size": 28, "family": "fonts/Lato-Bold.ttf", "colour": {"r": 255, "g": 255, "b": 255}}},
+            {"multiline": "True", "centered": "False", "wrap_width": 28, "slot": "session_title",
+             "position": {"x": 80, "y": 440},
+             "font": {"size": 48, "family": "fonts/Lato-Bold.ttf", "colour": {"r": 255, "g": 255, "b": 255}}}
+        ]
+    }
+}
+
+
+def make_fixtures(directory, sessions, speakers, seed=1):
+    """Writes a template and avatars to directory and returns the session values"""
+    rng = random.Random(seed)
+    os.makedirs(directory + "/output/images", exist_ok=True)
+    # Gradient template the size of the Connect placeholders
+    template = Image.new("RGB", (1200, 630))
+    draw = ImageDraw.Draw(template)
+    for y in range(630):
+        draw.line((0, y, 1200, y), fill=(20, 40 + y // 8, 90 + y // 6))
+    template.save(directory + "/template.jpg", quality=90)
+    # Noisy phone sized avatars so decoding costs what real photos do, drawn from rng
+    # so every run and version decodes the same bytes
+    for number in range(speakers):
+        size = 1600 * 1200 * 3
+        avatar = Image.frombytes("RGB", (1600, 1200), rng.getrandbits(size * 8).to_bytes(size, "little"))
+        avatar.save("{0}/output/images/speaker-{1}.jpg".format(directory, number), quality=90)
+    values = []
+    for number in range(sessions):
+        speaker = rng.randrange(speakers)
+        values.append({
+            "file_name": "BENCH-{}".format(number),
+            "speaker_image": "speaker-{}.jpg".format(speaker),
+            "speakers": "Speaker {0} {1}, Engineer at Linaro".format(speaker, rng.choice(WORDS).title()),
+            "session_id": "BENCH-{}".format(number),
+            "event_type": rng.choice(("Keynote", "Session", "Training", "TBC")),
+            "session_title": " ".join(rng.choice(WORDS) for word in range(rng.randint(3, 12))).title(),
+        })
+    return values
+
+
+def make_generator(directory, settings=None):
+    """Returns a quiet SocialImageGenerator writing under directory, collecting metrics where supported"""
+    options = {"output": directory + "/output", "assets_path": ASSETS_PATH,
+               "template": directory + "/template.jpg", "metrics": True}
+    if settings:
+        options.update(settings)
+    generator = SocialImageGenerator(options)
+    generator._verbose = False
+    return generator
+
+
+def make_options(values):
+    """
+    Fills the LAYOUT slots with each session's values, giving plain options
+    dictionaries that every version of create_image accepts
+    """
+    options_list = []
+    for session in values:
+        options = {"file_name": session["file_name"], "elements": {}}
+        for kind, elements in LAYOUT["elements"].items():
+            options["elements"][kind] = []
+            for element in elements:
+                element = dict(element)
+                slot = element.pop("slot")
+                element["image_name" if kind == "images" else "value"] = session[slot]
+                options["elements"][kind].append(element)
+        options_list.append(options)
+    return options_list
+
+
+def clear_caches(generator):
+    """Empties the process wide caches of versions that have them so a scenario starts cold"""
+    caches = [getattr(social_image_generator, name, None)
+              for name in ("font_cache", "layout_cache", "text_run_cache", "mask_cache", "thumbnail_cache")]
+    caches.append(getattr(generator, "template_cache", None))
+    for cache in caches:
+        if cache is not None:
+            cache.clear()
+
+
+def metrics_summary(generator):
+    """Returns the stage timings and cache stats of versions that collect metrics"""
+    metrics = getattr(generator, "metrics", None)
+    if metrics is None or not getattr(metrics, "enabled", False):
+        return {}
+    summary = metrics.summary()
+    return {"stages": summary["timings"], "caches": summary["caches"]}
+
+
+def summarize(samples):
+    """Returns the mean, median and 95th percentile of a list of seconds in milliseconds"""
+    samples = sorted(samples)
+    return {
+        "mean_ms": statistics.mean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def bench_single(directory, values, workers):
+    """Renders every session one at a time in this process with create_image"""
+    generator = make_generator(directory)
+    clear_caches(generator)
+    options_list = make_options(values)
+    totals = []
+    start = time.perf_counter()
+    for options in options_list:
+        image_start = time.perf_counter()
+        generator.create_image(options)
+        totals.append(time.perf_counter() - image_start)
+    if hasattr(generator, "flush"):
+        generator.flush()
+    elapsed = time.perf_counter() - start
+    result = {"images": len(options_list), "seconds": elapsed, "images_per_second": len(options_list) / elapsed,
+              "latency": summarize(totals)}
+    result.update(metrics_summary(generator))
+    return result
+
+
+def bench_batch(directory, values, workers):
+    """
+    Renders every session with create_images across worker processes, or one at a
+    time with create_image in versions without batch rendering
+    """
+    generator = make_generator(directory)
+    clear_caches(generator)
+    options_list = make_options(values)
+    start = time.perf_counter()
+    if hasattr(generator, "create_images"):
+        failed = sum(1 for result in generator.create_images(options_list, workers=workers) if result.error)
+    else:
+        workers = 1
+        failed = 0
+        for options in options_list:
+            generator.create_image(options)
+    elapsed = time.perf_counter() - start
+    result = {"images": len(options_list), "workers": workers, "failed": failed, "seconds": elapsed,
+              "images_per_second": len(options_list) / elapsed}
+    result.update(metrics_summary(generator))
+    return result
+
+
+def bench_thumbnails(directory, values, workers):
+    """Crops every avatar cold and then again from the warm cache"""
+    generator = make_generator(directory)
+    clear_caches(generator)
+    avatars = sorted(set(session["speaker_image"] for session in values))
+    timings = {}
+    for phase in ("cold", "warm"):
+        samples = []
+        for avatar in avatars:
+            start = time.perf_counter()
+            generator.create_circle_thumbnail("images/", avatar, (300, 300), "circle_thumbs/")
+            samples.append(time.perf_counter() - start)
+        timings[phase] = summarize(samples)
+        timings[phase]["thumbnails_per_second"] = len(samples) / sum(samples)
+    return {"avatars": len(avatars), "timings": timings}
+
+
+SCENARIOS = {
+    "single": bench_single,
+    "batch": bench_batch,
+    "thumbnails": bench_thumbnails,
+}
+
+
+def run_scenario(name, directory, values, workers, trace_memory=False):
+    """
+    Runs a scenario measuring its peak RSS and, if trace_memory is set, its peak
+    Python allocations. Tracing slows rendering down so it is off by default.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    result = SCENARIOS[name](directory, values, workers)
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    result["peak_children_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return result
+
+
+def environment():
+    """Returns details of the machine and code being benchmarked"""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "pillow": PIL.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+
+def compare(current, baseline):
+    """Prints the images per second of each scenario against a baseline run"""
+    print("\n{0:<12}{1:>12}{2:>12}{3:>10}".format("scenario", "baseline", "current", "change"))
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name, {})
+        for key in ("images_per_second",):
+            if key in result and key in before:
+                change = (result[key] - before[key]) / before[key] * 100
+                print("{0:<12}{1:>12.2f}{2:>12.2f}{3:>9.1f}%".format(name, before[key], result[key], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the social image rendering pipeline.")
+    parser.add_argument("--sessions", type=int, default=60, help="Number of synthetic sessions.")
+    parser.add_argument("--speakers", type=int, default=15, help="Number of distinct speaker avatars.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for the batch scenario.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run, may be repeated. Defaults to all.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report peak Python allocations (slows rendering down).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Compare against the JSON results of an earlier run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        values = make_fixtures(directory, args.sessions, args.speakers)
+        results = {"environment": environment(), "parameters": vars(args), "scenarios": {}}
+        for name in args.scenario or sorted(SCENARIOS):
+            # Each scenario runs in a fresh process so caches and peak RSS are its own
+            with futures.ProcessPoolExecutor(max_workers=1) as executor:
+                results["scenarios"][name] = executor.submit(
+                    run_scenario, name, directory, values, args.workers, args.trace_memory).result()
+            print(name, json.dumps(results["scenarios"][name], indent=1, sort_keys=True))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
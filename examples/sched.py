@@ -1,3 +1,4 @@
+import argparse
 import re
 from slugify import slugify
 import sys
@@ -6,9 +7,111 @@ sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 import requests
 from social_image_generator import SocialImageGenerator
+from social_image_generator import get_sched_api_key
+from social_image_generator import UserDirectory
+from social_image_generator import serve
+from social_image_generator import in_shard
 from sched_data_interface import SchedDataInterface
 
-from secrets import SCHED_API_KEY
+
+# Static layout of a session image, the slots are bound per session
+SESSION_LAYOUT = {
+    "elements": {
+        "images": [
+            {
+                "dimensions": {
+                    "x": 300,
+                    "y": 300
+                },
+                "position": {
+                    "x": 820,
+                    "y": 80
+                },
+                "slot": "speaker_image",
+                "circle": "True"
+            }
+        ],
+        "text": [
+            {
+                "multiline": "True",
+                "centered": "True",
+                "wrap_width": 28,
+                "slot": "speakers",
+                "position": {
+                    "x": [920, 970],
+                    "y": 400
+                },
+                "font": {
+                    "size": 32,
+                    "family": "fonts/Lato-Regular.ttf",
+                    "colour": {
+                        "r": 255,
+                        "g": 255,
+                        "b": 255
+                    }
+                }
+            },
+            {
+                "multiline": "False",
+                "centered": "False",
+                "wrap_width": 28,
+                "slot": "session_id",
+                "position": {
+                    "x": 80,
+                    "y": 340
+                },
+                "font": {
+                    "size": 48,
+                    "family": "fonts/Lato-Bold.ttf",
+                    "colour": {
+                        "r": 255,
+                        "g": 255,
+                        "b": 255
+                    }
+                }
+            },
+            {
+                "multiline": "False",
+                "centered": "False",
+                "wrap_width": 28,
+                "slot": "event_type",
+                "position": {
+                    "x": 80,
+                    "y": 400
+                },
+                "font": {
+                    "size": 28,
+                    "family": "fonts/Lato-Bold.ttf",
+                    "colour": {
+                        "r": 255,
+                        "g": 255,
+                        "b": 255
+                    }
+                }
+            },
+            {
+                "multiline": "True",
+                "centered": "False",
+                "wrap_width": 28,
+                "slot": "session_title",
+                "position": {
+                    "x": 80,
+                    "y": 440
+                },
+                "font": {
+                    "size": 48,
+                    "family": "fonts/Lato-Bold.ttf",
+                    "colour": {
+                        "r": 255,
+                        "g": 255,
+                        "b": 255
+                    }
+                }
+            }
+        ]
+    }
+}
+
 
 class ConnectImageGenerator:
     """
@@ -16,16 +119,21 @@ class ConnectImageGenerator:
     sessions from Sched.com and uses the SocialImageGenerator
     to generate unique placeholder images.
     """
-    def __init__(self):
-        self.API_KEY = SCHED_API_KEY
+    def __init__(self, force=False, workers=None, serve_port=None, shard=None, merge_shards=None):
+        self.API_KEY = get_sched_api_key()
         # Setup a new instance of the SocialImageGenerator object
         self.social_image_generator = SocialImageGenerator(
-            {"output": "output", "assets_path": "assets", "template": "/home/kyle/Documents/scripts_and_snippets/ConnectAutomation/social_image_generator/assets/templates/bud20-placeholder.jpg"})
+            {"output": "output", "assets_path": "assets", "avatar_cache": "avatar_cache", "normalized_avatars": "avatar_cache/normalized", "incremental": True, "shard": shard, "template": "/home/kyle/Documents/scripts_and_snippets/ConnectAutomation/social_image_generator/assets/templates/bud20-placeholder.jpg"})
         # Setup SchedDataInterface instance
         data_interface = SchedDataInterface(
-            "https://bud20.sched.com", SCHED_API_KEY, "BUD20")
+            "https://bud20.sched.com", self.API_KEY, "BUD20")
         json_data = data_interface.getSessionsData()
-        self.generate(json_data)
+        if serve_port is not None:
+            self.serve(json_data, serve_port)
+        elif merge_shards:
+            self.merge_shards(json_data, merge_shards)
+        else:
+            self.generate(json_data, workers=workers, force=force)
 
     def get_api_results(self, endpoint):
         """
@@ -60,137 +168,130 @@ class ConnectImageGenerator:
             Downloads the session speaker images based on an array of speakers passed in
             Returns: speakers array with downloaded image paths
         """
+        downloads = []
         for speaker in session_speakers_arr:
             speaker_avatar_url = speaker["avatar"]
             if len(speaker_avatar_url) < 3:
                 speaker["image"] = "placeholder.jpg"
             else:
-                file_name = self.social_image_generator.grab_photo(
-                    speaker_avatar_url, slugify(speaker["name"]))
-                speaker["image"] = file_name
+                downloads.append(speaker)
+        # Fetch all the avatars concurrently
+        results = self.social_image_generator.grab_photos(
+            [(speaker["avatar"], slugify(speaker["name"])) for speaker in downloads])
+        for speaker, result in zip(downloads, results):
+            if result.ok:
+                speaker["image"] = result.file_name
+            else:
+                print(result.error)
+                speaker["image"] = "placeholder.jpg"
         return session_speakers_arr
 
-    def generate(self, json_data):
+    def speaker_key(self, speaker):
+        """Returns the key a speaker is looked up by in the speaker directory"""
+        return speaker.get("username") or speaker["name"]
+
+    def download_first_speaker_images(self, json_data):
         """
-        This method does the actual generation of images using
-        the social_image_generator.
+            Downloads the first speaker image of every session concurrently, once per speaker
+            Returns: UserDirectory of the first speakers with their downloaded image file name
         """
+        speakers = UserDirectory()
         for session in json_data.values():
             try:
-                speaker_avatar_url = session["speakers"][0]["avatar"]
-                if len(speaker_avatar_url) < 3:
-                    speaker_image = "placeholder.jpg"
-                else:
-                    file_name = self.social_image_generator.grab_photo(
-                        speaker_avatar_url, slugify(session["speakers"][0]["name"]))
-                    speaker_image = file_name
-                session_speakers = session["speakers"][0]["name"]
+                speakers.add(session["speakers"][0])
             except Exception as e:
-                print("{} has no speakers".format(session["name"]))
-                speaker_image = "placeholder.jpg"
-                session_speakers = "TBC"
-            # speakers_list = session["speakers"]
-            # Create the image options dictionary
-            image_options = {
-                "file_name": session["session_id"],
-                "elements": {
-                    "images": [
-                        {
-                            "dimensions": {
-                                "x": 300,
-                                "y": 300
-                            },
-                            "position": {
-                                "x": 820,
-                                "y": 80
-                            },
-                            "image_name": speaker_image,
-                            "circle": "True"
-                        }
-                    ],
-                    "text": [
-                        {
-                            "multiline": "True",
-                            "centered": "True",
-                            "wrap_width": 28,
-                            "value": session_speakers,
-                            "position": {
-                                "x": [920, 970],
-                                "y": 400
-                            },
-                            "font": {
-                                "size": 32,
-                                "family": "fonts/Lato-Regular.ttf",
-                                "colour": {
-                                    "r": 255,
-                                    "g": 255,
-                                    "b": 255
-                                }
-                            }
-                        },
-                        {
-                            "multiline": "False",
-                            "centered": "False",
-                            "wrap_width": 28,
-                            "value": session["session_id"],
-                            "position": {
-                                "x": 80,
-                                "y": 340
-                            },
-                            "font": {
-                                "size": 48,
-                                "family": "fonts/Lato-Bold.ttf",
-                                "colour": {
-                                    "r": 255,
-                                    "g": 255,
-                                    "b": 255
-                                }
-                            }
-                        },
-                        {
-                            "multiline": "False",
-                            "centered": "False",
-                            "wrap_width": 28,
-                            "value": session["event_type"],
-                            "position": {
-                                "x": 80,
-                                "y": 400
-                            },
-                            "font": {
-                                "size": 28,
-                                "family": "fonts/Lato-Bold.ttf",
-                                "colour": {
-                                    "r": 255,
-                                    "g": 255,
-                                    "b": 255
-                                }
-                            }
-                        },
-                        {
-                            "multiline": "True",
-                            "centered": "False",
-                            "wrap_width": 28,
-                            "value": session["session_title"],
-                            "position": {
-                                "x": 80,
-                                "y": 440
-                            },
-                            "font": {
-                                "size": 48,
-                                "family": "fonts/Lato-Bold.ttf",
-                                "colour": {
-                                    "r": 255,
-                                    "g": 255,
-                                    "b": 255
-                                }
-                            }
-                        }
-                    ],
-                }
-            }
-            # Generate the image for each sesssion
-            self.social_image_generator.create_image(image_options)
+                continue
+        self.download_speaker_images(list(speakers))
+        return speakers
+
+    def session_values(self, session, speakers):
+        """Returns the values of the SESSION_LAYOUT slots for a session"""
+        try:
+            speaker = speakers[self.speaker_key(session["speakers"][0])]
+            speaker_image = speaker["image"]
+            session_speakers = speaker["name"]
+        except Exception as e:
+            print("{} has no speakers".format(session["name"]))
+            speaker_image = "placeholder.jpg"
+            session_speakers = "TBC"
+        # speakers_list = session["speakers"]
+        return {
+            "speaker_image": speaker_image,
+            "speakers": session_speakers,
+            "session_id": session["session_id"],
+            "event_type": session["event_type"],
+            "session_title": session["session_title"],
+        }
+
+    def serve(self, json_data, port):
+        """
+        Serves each session image on demand at /<session_id>.png, with any slot
+        overridden by a query parameter e.g. /BUD20-K1.png?session_title=Keynote
+        """
+        speakers = self.download_first_speaker_images(json_data)
+        sessions = {session["session_id"]: session for session in json_data.values()}
+
+        def lookup(session_id):
+            if session_id not in sessions:
+                return None
+            return self.session_values(sessions[session_id], speakers)
+
+        layout = self.social_image_generator.compile_layout(SESSION_LAYOUT)
+        serve(self.social_image_generator, layout, host="0.0.0.0", port=port, lookup=lookup)
+
+    def merge_shards(self, json_data, count):
+        """
+        Combines the manifests of count shards and checks that together they
+        rendered every session
+        """
+        expected = [session["session_id"] for session in json_data.values()]
+        problems = self.social_image_generator.merge_shards(count, expected)
+        for problem in problems:
+            print(problem)
+        print("Merged {0} shards, {1} problems".format(count, len(problems)))
+        return not problems
+
+    def generate(self, json_data, workers=None, force=False):
+        """
+        This method does the actual generation of images using
+        the social_image_generator.
+        """
+        # Only fetch speakers for the sessions in this run's shard
+        shard = self.social_image_generator.shard
+        json_data = {key: session for key, session in json_data.items()
+                     if in_shard(session["session_id"], shard)}
+        speakers = self.download_first_speaker_images(json_data)
+        # Compile the layout once and render every session from it
+        layout = self.social_image_generator.compile_layout(SESSION_LAYOUT)
+        image_options_list = []
+        for session in json_data.values():
+            # Bind the session values to the compiled layout
+            image_options_list.append(layout.bind(
+                session["session_id"], **self.session_values(session, speakers)))
+        # Generate the images for all sessions across a pool of workers
+        results = self.social_image_generator.create_images(
+            image_options_list, workers=workers, force=force)
+        for result in results:
+            if result.error:
+                print("Failed to generate {}:\n{}".format(
+                    result.file_name, result.error))
+        print("Rendered: {rendered}, Skipped: {skipped}, Failed: {failed}, Peak RSS: {peak_rss_mb} MiB (workers {worker_peak_rss_mb} MiB)".format(
+            **self.social_image_generator.render_summary))
 
 
 if __name__ == "__main__":
-    generator = ConnectImageGenerator()
+    parser = argparse.ArgumentParser(
+        description="Generate session images for a Sched.com event.")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-render every image even if its inputs are unchanged.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of render processes (defaults to the CPU count).")
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT",
+                        help="Serve session images on demand on this port instead of rendering them all.")
+    parser.add_argument("--shard", default=None,
+                        help="Only render the sessions in shard i of N, written as i/N.")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="N",
+                        help="Combine the manifests of N shards and check they cover every session.")
+    args = parser.parse_args()
+    generator = ConnectImageGenerator(force=args.force, workers=args.workers, serve_port=args.serve,
+                                      shard=args.shard, merge_shards=args.merge_shards)
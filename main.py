@@ -1,19 +1,38 @@
-from PIL import Image
-from PIL import ImageFont
 from PIL import ImageDraw
-from PIL import ImageOps
-from urllib import request
 import requests
+import argparse
 import io
-import textwrap
-import csv
 import os
 import pickle
 import ast
 import re
+import time
 from slugify import slugify
 from urllib.parse import urlparse
-from secrets import SCHED_API_KEY
+from concurrent import futures
+from social_image_generator.cache import TemplateCache
+from social_image_generator.config import get_sched_api_key
+from social_image_generator.thumbnails import circle_thumbnail
+from social_image_generator.text_layout import draw_text_run
+from social_image_generator.text_layout import layout_text
+from social_image_generator.download import Downloader
+from social_image_generator.avatars import AvatarStore
+from social_image_generator.manifest import RenderManifest
+from social_image_generator.manifest import inputs_digest
+from social_image_generator.encoders import BackgroundWriter
+from social_image_generator.encoders import Encoder
+from social_image_generator.pipeline import run_pipeline
+from social_image_generator.store import SchedStore
+from social_image_generator.records import read_sched_sessions
+from social_image_generator.records import read_sessions
+from social_image_generator.records import read_users
+from social_image_generator.users import UserDirectory
+from social_image_generator.shards import in_shard
+from social_image_generator.shards import merge_shard_manifests
+from social_image_generator.shards import parse_shard
+from social_image_generator.shards import record_assigned
+from social_image_generator.shards import shard_manifest_path
+
 
 class SocialMediaImageAutomation:
     """
@@ -21,7 +40,7 @@ class SocialMediaImageAutomation:
     pathable. It combines the users export and the sessions export to create social
     share images for the website and social media promotion.
     """
-    def __init__(self, media_templates, using_api=False, data_src_file_name="sessions.csv", user_src_file_name="users.csv", local_file_folder="resources/",output_path="output/"):
+    def __init__(self, media_templates, using_api=False, data_src_file_name="sessions.csv", user_src_file_name="users.csv", local_file_folder="resources/",output_path="output/", force=False, offline=False, shard=None, merge_shards=None):
 
         # Get the data source csv file
         self._data_src_file_name = data_src_file_name
@@ -35,31 +54,40 @@ class SocialMediaImageAutomation:
         self.output_path = os.getcwd() + "/" + output_path
         # Circle Thumbnail Size
         self.circle_thumb_size = (300, 300)
+        # Write circle thumbnails next to the speaker photos
+        self.save_thumbnails = False
+        # Upright speaker photos fitted to the thumbnail size, decoded once across runs
+        self.normalized_avatars_path = self.local_resources_path + "normalized_avatars/"
         # Sched.com API Key
-        self.API_KEY = SCHED_API_KEY
+        self.API_KEY = get_sched_api_key()
+        # Keep-alive session reused for all Sched.com API calls
+        self.api_session = requests.Session()
         # Path to the speaker photos
         self._photos_path = "photos/"
+        # Pooled downloader used for speaker photos, cached and revalidated across runs
+        self.downloader = Downloader(store=AvatarStore(self.local_resources_path + "avatar_cache/"))
         self.speaker_image_path = "/assets/images/speakers/san19/"
+        # Local copy of the Sched.com sessions and users synced incrementally between runs
+        self.store = SchedStore(self.local_resources_path + "sched.sqlite")
+        # Refetch the user list when it is older than this many seconds
+        self.user_max_age = 24 * 60 * 60
         # Placeholder types supported by the social media image generator
         self._types = ["san19-placeholder.jpg"]
 
         # Verbose Setting
         self._verbose = True
-
-        # Get the users data
-        # Get the sessions data
-        # self._sessions_data = self.grab_session_data_from_csv()
-        # Grab session data from sched.com api
-        self._sessions_data = self.grab_session_data_from_sched()
-        self.users = {}
-        self.grab_users_data_from_sched()
-        self._sessions_data =  self.generate_revised_sessions(self.users)
+        # Number of speakers whose avatars and bios are fetched together
+        self.speaker_batch_size = 16
+        # Number of sessions waiting between two pipeline stages
+        self.pipeline_queue_size = 16
 
         # Youtube Thumbnail Image URl
         self.youtube_thumbnail_image = "https://img.youtube.com/vi/{0}/sddefault.jpg"
 
         # Background image template
         self.template_images = media_templates
+        # Decoded templates shared between renders
+        self.template_cache = TemplateCache()
 
         # Offset of the photo
         self.photo_offset = (820,80)
@@ -83,8 +111,50 @@ class SocialMediaImageAutomation:
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
 
-        for template in self.template_images:
-            self.create_social_media_images(template)
+        # Slice of the sessions this run renders e.g "2/4", every session if None
+        if shard:
+            self.shard = parse_shard(shard)
+        else:
+            self.shard = None
+        # Manifest of rendered images used to skip unchanged sessions unless forced,
+        # one per shard when the sessions are split across machines
+        self.manifest_path = self.output_path.rstrip("/") + ".manifest.json"
+        if self.shard is not None:
+            self.manifest = RenderManifest(shard_manifest_path(self.manifest_path, self.shard))
+        else:
+            self.manifest = RenderManifest(self.manifest_path)
+        self.force = force
+        self.render_summary = {"rendered": 0, "skipped": 0}
+        # PNG encoder and the background threads that encode and write each image
+        # while the next session is being drawn
+        self.encoder = Encoder(format="png", compress_level=6)
+        self.writer = BackgroundWriter(max_workers=2)
+
+        # Bring the local store up to date with sched.com unless working offline from it
+        if not offline:
+            self.sync_sched_data()
+        # Get the users data
+        self.users = UserDirectory()
+        self.load_users()
+        if merge_shards:
+            self.merge_shards(merge_shards)
+            return
+        # Stream the sessions from the store and render each one as soon as it is ready
+        # self.create_social_media_images(self.template_images, self.session_pipeline(self.grab_sched_sessions_from_csv()))
+        self.create_social_media_images(self.template_images, self.session_pipeline(self.store.sessions()))
+        print("Rendered: {rendered}, Skipped: {skipped}".format(**self.render_summary))
+
+    def session_pipeline(self, sessions):
+        """
+        Returns a generator of revised sessions streamed through the normalizing, speaker
+        download and revising stages, each running on its own thread with bounded queues
+        in between so rendering starts with the first session and memory stays flat.
+        """
+        return run_pipeline(sessions, [
+            lambda items: self.parse_sessions(items, self.users),
+            self.prepare_speakers,
+            self.revise_sessions,
+        ], maxsize=self.pipeline_queue_size)
 
     def get_api_results(self, endpoint):
         """
@@ -92,20 +162,103 @@ class SocialMediaImageAutomation:
         """
         full_url = self.sched_url + endpoint.format(self.API_KEY)
         try:
-            resp = requests.get(url=full_url)
+            resp = self.api_session.get(url=full_url)
             data = resp.json()
             return data
         except Exception as e:
             print(e)
             return False
 
+    def parse_session_title(self, session):
+        """
+        Returns the (session_id, session_name) parsed from a session title or None
+        if the session is in a blacklisted track or has no session id.
+        """
+        blacklistedTracks =  ["Food & Beverage","Informational"]
+        if session.get("event_type") in blacklistedTracks:
+            return None
+        session_title = session["name"]
+        # Get the session id from the title
+        try:
+            session_id_regex = re.compile('SAN19-[A-Za-z]*[0-9]+K*[0-9]*')
+            print(session_title)
+            session_id = session_id_regex.findall(session_title)[0]
+            session_name = re.sub("SAN19-[A-Za-z]*[0-9]+K*[0-9]*", "", session_title).strip()
+        # Check to see if a session id exists in the title
+        # if not then skip this session - marking as invalid if no session id is present.
+        except Exception as e:
+            print(e)
+            return None
+        return session_id, session_name
+
     def generate_revised_sessions(self, users_data):
-        revised_sessions = []
-        for session in self._sessions_data:
+        """Returns the list of revised sessions for every stored session"""
+        return list(self.revise_sessions(self.prepare_speakers(
+            self.parse_sessions(self.store.sessions(), users_data))))
+
+    def parse_sessions(self, sessions, users_data):
+        """
+        Yields (session, (session_id, session_name), speakers) for each valid session,
+        resolving the speakers against the users_data UserDirectory.
+        """
+        for session in sessions:
+            parsed_title = self.parse_session_title(session)
+            if parsed_title is None:
+                continue
+            # Leave sessions belonging to other shards to the machines rendering them
+            if not in_shard(parsed_title[0], self.shard):
+                continue
+            try:
+                session_speakers = session["speakers"].split(",")
+            except KeyError as e:
+                session_speakers = None
+            # Gather the session speakers details
+            if session_speakers is not None:
+                session_speakers_arr, missing = users_data.resolve(session_speakers)
+                if missing:
+                    with open("missing_speakers.txt", "a+") as my_file:
+                        my_file.write("{0}: {1}\n".format(session["name"], ", ".join(missing)))
+            else:
+                with open("missing_speakers.txt", "a+") as my_file:
+                    my_file.write(session["name"] + "\n")
+                session_speakers_arr = None
+            yield session, parsed_title, session_speakers_arr
+
+    def prepare_speakers(self, parsed_sessions):
+        """
+        Downloads the avatars and fetches any missing bios of the speakers of parsed
+        sessions, in bulk for each batch of sessions so every new speaker is only
+        fetched once however many sessions they speak in. A batch holds at most
+        pipeline_queue_size sessions. Yields the parsed sessions.
+        """
+        prepared = set()
+        batch = []
+        new_speakers = {}
+        for parsed_session in parsed_sessions:
+            batch.append(parsed_session)
+            for speaker in parsed_session[2] or []:
+                key = speaker.get("username") or speaker["name"]
+                if key not in prepared:
+                    prepared.add(key)
+                    new_speakers[key] = speaker
+            # Flush on enough new speakers, or enough sessions of already prepared ones
+            if len(new_speakers) >= self.speaker_batch_size or len(batch) >= self.pipeline_queue_size:
+                yield from self._prepare_batch(batch, new_speakers)
+                batch = []
+                new_speakers = {}
+        yield from self._prepare_batch(batch, new_speakers)
+
+    def _prepare_batch(self, batch, new_speakers):
+        """Downloads and fetches bios for new_speakers, returning the batch of sessions"""
+        speakers = list(new_speakers.values())
+        self.download_speaker_images(speakers)
+        self.get_speaker_bios(speakers)
+        return batch
+
+    def revise_sessions(self, prepared_sessions):
+        """Yields the revised session for each parsed session with prepared speakers"""
+        for session, (session_id, session_name), session_speakers_arr in prepared_sessions:
             # Grab the relevant data from the sessions results
-            sched_event_id = session["event_key"]
-            session_active = session["active"]
-            session_title = session["name"]
             session_start_time = session["event_start"]
             session_end_time = session["event_end"]
             try:
@@ -121,115 +274,101 @@ class SocialMediaImageAutomation:
             except Exception as e:
                 session_abstract = "Coming soon..."
             session_attendee_num = session["goers"]
-            session_private = session["invite_only"]
             try:
                 session_room = session["venue"]
             except Exception as e:
                 session_room = None
-            try:
-                session_venue_id = session["venue_id"]
-            except Exception as e:
-                pass
-            session_id_hash = session["id"]
-            try:
-                session_speakers = session["speakers"].split(",")
-            except KeyError as e:
-                session_speakers = None
 
-            blacklistedTracks =  ["Food & Beverage","Informational"]
-            if session_track not in blacklistedTracks:
-                # Get the session id from the title
-                try:
-                    session_id_regex = re.compile('SAN19-[A-Za-z]*[0-9]+K*[0-9]*')
-                    print(session_title)
-                    session_id = session_id_regex.findall(session_title)[0]
-                    session_name = re.sub("SAN19-[A-Za-z]*[0-9]+K*[0-9]*", "", session_title).strip()
-                    skipping = False
-                # Check to see if a session id exists in the title
-                # if not then skip this session - marking as invalid if no session id is present.
-                except Exception as e:
-                    skipping = True
-                    print(e)
-            else:
-                skipping = True
-            if skipping == False:
-                # Gather the session speakers details
-                if session_speakers is not None:
-                    session_speakers_arr = []
-                    for speaker in session_speakers:
-                        speaker_name = speaker.strip()
-                        speaker = users_data[speaker_name]
-                        session_speakers_arr.append(speaker)
-                    session_speakers_arr =  self.download_speaker_images(session_speakers_arr)
-                else:
-                    with open("missing_speakers.txt", "a+") as my_file:
-                        my_file.write(session["name"] + "\n")
-                    session_speakers_arr = None
-
-                revised_speakers = []
-                if session_speakers_arr != None:
-                    for speaker in session_speakers_arr:
-                        # Gets the speaker bio
-                        speaker_details = self.get_speaker_bio(speaker)
-                        revised_speakers.append({
-                            "speaker_name": speaker_details["name"],
-                            "speaker_username": speaker_details["username"],
-                            "speaker_company": speaker_details["company"],
-                            "speaker_position": speaker_details["position"],
-                            "speaker_location": speaker_details["location"],
-                            "speaker_image": speaker_details["image"],
-                            "speaker_bio":  "{}".format(speaker_details["bio"]).replace("'",""),
-                        })
-
-                session_image = {
-                    "path": "/assets/images/featured-images/san19/" + session_id + ".png",
-                    "featured": "true",
-                }
-
-                session_slot = {
-                    "start_time": session_start_time,
-                    "end_time": session_end_time,
-                }
-                # Session Tracks
-
-                if session_sub_track != None:
-                    session_tracks = session_sub_track.split(",")
-
-                if session_track != None:
-                    main_track = session_track.strip()
-
-
-                with open("titles.txt", "a+") as my_file:
-                    my_file.write(session_name + "\n")
-
-                post_frontmatter = {
-                        "title": session_name,
-                        "session_id": session_id,
-                        "session_speakers": revised_speakers,
-                        "description": "{}".format(session_abstract).replace("'",""),
-                        "future_image": session_image,
-                        "session_room": session_room,
-                        "session_slot": session_slot,
-                        "tags": session_tracks,
-                        "categories": [self.connect_code],
-                        "session_track": session_track,
-                        "session_attendee_num": session_attendee_num,
-                        "tag": "session",
-                }
-                revised_sessions.append(post_frontmatter)
-
-        return revised_sessions
-
-
-    def grab_session_data_from_sched(self):
+            revised_speakers = []
+            if session_speakers_arr != None:
+                for speaker_details in session_speakers_arr:
+                    revised_speakers.append({
+                        "speaker_name": speaker_details["name"],
+                        "speaker_username": speaker_details["username"],
+                        "speaker_company": speaker_details["company"],
+                        "speaker_position": speaker_details["position"],
+                        "speaker_location": speaker_details["location"],
+                        "speaker_image": speaker_details["image"],
+                        "speaker_bio":  "{}".format(speaker_details["bio"]).replace("'",""),
+                    })
+
+            session_image = {
+                "path": "/assets/images/featured-images/san19/" + session_id + ".png",
+                "featured": "true",
+            }
+
+            session_slot = {
+                "start_time": session_start_time,
+                "end_time": session_end_time,
+            }
+            # Session Tracks
+
+            if session_sub_track != None:
+                session_tracks = session_sub_track.split(",")
+
+            if session_track != None:
+                main_track = session_track.strip()
+
+
+            with open("titles.txt", "a+") as my_file:
+                my_file.write(session_name + "\n")
+
+            post_frontmatter = {
+                    "title": session_name,
+                    "session_id": session_id,
+                    "session_speakers": revised_speakers,
+                    "description": "{}".format(session_abstract).replace("'",""),
+                    "future_image": session_image,
+                    "session_room": session_room,
+                    "session_slot": session_slot,
+                    "tags": session_tracks,
+                    "categories": [self.connect_code],
+                    "session_track": session_track,
+                    "session_attendee_num": session_attendee_num,
+                    "tag": "session",
+            }
+            yield post_frontmatter
+
+
+    def grab_session_data_from_sched(self, since=1282755813):
         """
-        Grabs the session data from sched.com api
+        Grabs the session data changed since a unix time from sched.com api
         """
-        sessions = self.get_api_results("/api/session/list?api_key={0}&since=1282755813&format=json")
+        sessions = self.get_api_results("/api/session/list?api_key={0}&since=" + str(since) + "&format=json")
         return sessions
 
+    def sync_sched_data(self):
+        """
+        Updates the local store with the sessions changed since the last sync. The user
+        list cannot be asked for changes only, so it is refetched when a session names a
+        speaker the store does not know or it is older than user_max_age.
+        """
+        started = int(time.time())
+        since = self.store.last_sync("sessions")
+        if since is None:
+            sessions = self.grab_session_data_from_sched()
+        else:
+            sessions = self.grab_session_data_from_sched(since)
+        if sessions is not False:
+            self.store.update_sessions(sessions)
+            self.store.mark_synced("sessions", started)
+        # Collect the speaker names of every stored session
+        speaker_names = set()
+        for session in self.store.sessions():
+            if "speakers" in session:
+                speaker_names.update(speaker.strip() for speaker in session["speakers"].split(","))
+        users_synced = self.store.last_sync("users")
+        if (users_synced is None or started - users_synced > self.user_max_age
+                or self.store.missing_user_names(speaker_names)):
+            users = self.grab_users_data_from_sched()
+            if users is not False:
+                self.store.update_users(users)
+                self.store.mark_synced("users", started)
+        return True
+
     def add_user(self, user):
-        self.users[user["name"]] = {
+        """Adds a sched.com user to the user directory, merging it with any matching user"""
+        record = {
             "username": (user["username"]),
             "avatar": user["avatar"],
             "name": user["name"],
@@ -237,35 +376,35 @@ class SocialMediaImageAutomation:
             "company": user["company"],
             "position": user["position"]
         }
-        return True
-
-    def merge_user(self, user):
-        key = user["name"]
-        user_to_modify = self.users[key]
-        if user_to_modify["avatar"] != user["avatar"] and user["avatar"] != "":
-            user_to_modify["avatar"] = user["avatar"]
-        if user_to_modify["company"] != user["company"] and user["company"] != "":
-            user_to_modify["company"] = user["company"]
-        if user_to_modify["position"] != user["position"] and user["position"] != "":
-            user_to_modify["position"] = user["position"]
+        if "email" in user:
+            record["email"] = user["email"]
+        if "about" in user:
+            record["bio"] = user["about"]
+        self.users.add(record)
         return True
 
     def grab_users_data_from_sched(self):
         """
         Grabs the users data from sched.com api
         """
-        users_data =  self.get_api_results("/api/user/list?api_key={0}&format=json")
-        for user in users_data:
-            if user["name"] not in self.users:
-                self.add_user(user)
-            else:
-                self.merge_user(user)
+        # Ask for the bio ("about") in the list so speakers need no per-user lookup
+        users_data =  self.get_api_results(
+            "/api/user/list?api_key={0}&format=json&fields=username,name,about,avatar,location,company,position")
         return users_data
 
+    def load_users(self):
+        """Loads the users from the local store"""
+        for user in self.store.users():
+            self.add_user(user)
+        return self.users
+
     def get_speaker_bio(self, speaker):
         """
         Gets a speaker bio given a speaker speaker object
         """
+        # The bio is usually already present from the user list
+        if "bio" in speaker:
+            return speaker
         # Construct the API Query with the username added.
         api_query = "/api/user/get?api_key={0}&by=username&term=" + speaker["username"] + "&format=json"
         # Get the speaker details
@@ -275,22 +414,36 @@ class SocialMediaImageAutomation:
 
         return speaker
 
+    def get_speaker_bios(self, speakers):
+        """
+        Fills in the bio of every speaker missing one, fetching them concurrently
+        """
+        missing = [speaker for speaker in speakers if "bio" not in speaker]
+        if missing:
+            with futures.ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(self.get_speaker_bio, missing))
+        return speakers
+
     def download_speaker_images(self, session_speakers_arr):
         """
             Downloads the session speaker images based on an array of speakers passed in
             Returns: speakers array with downloaded image paths
         """
+        downloads = []
         for speaker in session_speakers_arr:
             speaker_avatar_url = speaker["avatar"]
             if len(speaker_avatar_url) < 3:
                 speaker["image"] = "placeholder.jpg"
             else:
-                file_name = self.grab_photo(speaker_avatar_url, slugify(speaker["name"]))
-                speaker["image"] = file_name
+                downloads.append((speaker, speaker_avatar_url, slugify(speaker["name"])))
+        # Fetch all the avatars concurrently
+        file_names = self.grab_photos([(url, name) for speaker, url, name in downloads])
+        for (speaker, url, name), file_name in zip(downloads, file_names):
+            speaker["image"] = file_name
         return session_speakers_arr
 
-    def grab_photo(self, url, output_filename, output_path="speaker_images/"):
-        """Fetches attendee photo from the pathable data"""
+    def _photo_path(self, url, output_filename):
+        """Returns the file name and local path for a downloaded photo"""
         # Get the filename parsed in
         file_name = output_filename
         # Extract the path from the URL
@@ -298,256 +451,239 @@ class SocialMediaImageAutomation:
         # Get the Extension from the path using os.path.splitext
         ext = os.path.splitext(path)[1]
         # Add output folder to output path
-        output =  self._photos_path + file_name + ext
-        # Try to download the image and Except errors and return as false.
-        try:
-            opener = request.build_opener()
-            opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-            request.install_opener(opener)
-            request.urlretrieve(url, output)
-        except Exception as e:
-            print(e)
-            image = False
-        return(file_name + ext)
+        return file_name + ext, self._photos_path + file_name + ext
+
+    def grab_photo(self, url, output_filename, output_path="speaker_images/"):
+        """Fetches attendee photo from the pathable data"""
+        return self.grab_photos([(url, output_filename)])[0]
+
+    def grab_photos(self, photos):
+        """Fetches many photos concurrently given (url, output_filename) pairs, returning the file names"""
+        downloads = [self._photo_path(url, output_filename) for url, output_filename in photos]
+        results = self.downloader.fetch_many(
+            [(url, output) for (url, output_filename), (file_name, output) in zip(photos, downloads)])
+        # Print any errors and carry on with the file names.
+        for result in results:
+            if not result.ok:
+                print(result.error)
+        return [file_name for file_name, output in downloads]
 
     def grab_session_data_from_csv(self):
-        """Fetches the session data from the pathable meetings export"""
-        my_file = self._data_src_file_name
-        with open(my_file, 'rt',encoding="utf8") as f:
-            reader = csv.reader(f)
-            csv_data = list(reader)
-            data = []
-            for each in csv_data:
-                title = each[4]
-                desc = each[5]
-                session_id = each[1]
-                speaker_names = each[10]
-                tracks = each[7]
-                new_dict = {
-                    "title":title,
-                    "blurb":desc,
-                    "session_id":session_id,
-                    "speakers":speaker_names,
-                    "tracks": tracks
-                }
-                data.append(new_dict)
-                print(new_dict["title"])
-        return data
+        """Yields the session data from the pathable meetings export one row at a time"""
+        return read_sessions(self._data_src_file_name)
+
+    def grab_sched_sessions_from_csv(self):
+        """Yields the sessions of the pathable meetings export shaped like sched.com sessions"""
+        return read_sched_sessions(self._data_src_file_name)
 
     def grab_user_data_from_csv(self):
-        """Fetches the user data from the pathable attendees csv export"""
-        my_file = self._user_src_file_name
-        with open(my_file, 'rt',encoding="utf8") as f:
-            reader = csv.reader(f)
-            csv_data = list(reader)
-            data = []
-            for each in csv_data:
-                email = each[12]
-                first_name = each[2]
-                second_name = each[3]
-                title = each[4]
-                company = each[6]
-                bio = each[7]
-                photo_url = each[16]
-                new_dict = {
-                    "speaker_email":email,
-                    "first_name":first_name,
-                    "second_name":second_name,
-                    "job_title":title,
-                    "company": company,
-                    "bio": bio,
-                    "photo_url": photo_url
-                }
-                data.append(new_dict)
-            # for each in data:
-            #     print(each)
-            #     input()
-        return data
+        """Yields the user data from the pathable attendees csv export one row at a time"""
+        return read_users(self._user_src_file_name)
 
     def get_users(self):
-        """ Get the users data from the pickle file or grab from users.csv"""
-        users = self.grab_user_data_from_csv()
-        # Download attendee photos from pathable.
-        for user in users:
+        """Yields the users from users.csv, downloading each attendee photo"""
+        for user in self.grab_user_data_from_csv():
+            # Download attendee photos from pathable.
             if user["photo_url"]:
                 username = user["first_name"] + user["second_name"]
                 photo_download = self.grab_photo(user["photo_url"], output_filename=username)
-                print(photo_download)
                 user["image-name"] = photo_download
-                # Dump the data into cache file
-        return users
+            yield user
 
 
     def get_sessions(self):
-        """ Get the sessions data from the pickle file or grab from sessions.csv"""
+        """ Yields the sessions data from sessions.csv"""
         sessions = self.grab_session_data_from_csv()
         return sessions
 
     def write_text(self, background_image_draw, text, coords, font_size, font, colour, centered=False, multiline=False, wrap_width=28):
         """Writes text to an image based on multiple parameters passed in"""
 
-        # Create an ImageFont object based on the font size and the font type we are using.
-        # This is used to calculate the dimensions of the text based on a specific size and font.
-        image_font = ImageFont.truetype(font, font_size)
-
-        # Check to see if the text is centered and if it is get x coords of the centered text
+        # Get the x coords of the text origin and the width of the box centered text sits in
         if centered:
-            # Get the width and height of the text.
-            text_width, text_height = image_font.getsize(text)
-            # Fetch x coords passed in.
             x = coords[0][0]
-            x2 = coords[0][1]
-            # Calculate the start of the new line.
-            text_x = x + ((x2 - x) - (text_width) / 2)
+            box_width = coords[0][1] - x
         else:
-            text_x = coords[0]
+            x = coords[0]
+            box_width = 0
 
-        # Create a tuple which (x,y) coords needed for the text method.
-        text_coords = (text_x,coords[1])
-
-        # Check to see if the text we are writing out should be on multiple lines.
-        if multiline == False:
-            background_image_draw.text(text_coords, text, colour, font=image_font)
-        else:
-            # Convert the text into multiple lines
-            lines = textwrap.wrap(text, width=wrap_width)
-            line_y = text_coords[1]
-            for line in lines:
-                # Get the width and height of each line.
-                width, height = image_font.getsize(line)
-                # Check to see if the text we are writing needs to be centered too.
-                if centered:
-                    # Calculate the width of each line of text in the multline text output
-                    x = coords[0][0]
-                    x2 = coords[0][1]
-                    # Calculate width of each line based on the width of that particular line
-                    text_x = x + ((x2 - x) - (width) / 2)
-                    background_image_draw.text((text_x,line_y), line, colour, font=image_font)
-                else:
-                    background_image_draw.text((text_coords[0],line_y), line, colour, font=image_font)
-                line_y += height
+        # Get the wrapped and measured lines from the shared layout cache
+        lines = layout_text(text, font, font_size, wrap_width, centered, multiline, box_width)
+        # Paste each line from the shared text run cache, rasterizing it on first use
+        for x_offset, y_offset, line in lines:
+            draw_text_run(background_image_draw, (x + x_offset, coords[1] + y_offset), line, font, font_size, colour)
 
         return background_image_draw
 
 
-    def create_social_media_images(self, media_template):
-        """Generates the social media images for a given media template based
-        on the sessions and users data collected in the constructor"""
+    def create_social_media_images(self, media_templates, sessions=None):
+        """Generates the social media images for each of the media templates for every
+        revised session in sessions, every stored session by
+        default. Sessions may be a generator, each one is rendered as it arrives."""
+        if sessions is None:
+            sessions = self.generate_revised_sessions(self.users)
+        if isinstance(media_templates, str):
+            media_templates = [media_templates]
         # Iterate through each session in the sessions data
-        for session in self._sessions_data:
-            # Grab session info from dictionary
-            title = session["title"]
-            speakers = session['session_speakers']
-            session_id = session["session_id"]
+        assigned = []
+        for session in sessions:
+            assigned.append(session["session_id"])
+            for media_template in media_templates:
+                self.create_social_media_image(media_template, session)
+
+        # Wait for the queued images to be written
+        self.writer.flush()
+        # Save the avatar cache, evicting stale avatars, once the downloads are done
+        self.downloader.close()
+        if self.shard is not None:
+            record_assigned(self.manifest, self.shard, assigned)
+        self.manifest.save()
+        return True
 
-            tracks = session["tags"]
+    def merge_shards(self, count):
+        """
+        Combines the manifests of count shards into the manifest of the output directory
+        and checks that together they rendered every valid session. Returns True if so.
+        """
+        expected = []
+        for session in self.store.sessions():
+            parsed_title = self.parse_session_title(session)
+            if parsed_title is not None:
+                expected.append(parsed_title[0])
+        problems = merge_shard_manifests(self.manifest_path, count, expected)
+        for problem in problems:
+            print(problem)
+        print("Merged {0} shards, {1} problems".format(count, len(problems)))
+        return not problems
+
+    def create_social_media_image(self, media_template, session):
+        """Generates the social media image for a revised session with a given media
+        template. Returns False if it was skipped as unchanged."""
+        # Grab session info from dictionary
+        title = session["title"]
+        speakers = session['session_speakers']
+        session_id = session["session_id"]
+
+        tracks = session["tags"]
+
+        # Skip sessions whose image was already rendered from identical inputs
+        output_file = self.output_path + session_id + ".png"
+        avatar_files = [self._photos_path + speaker["speaker_image"] for speaker in speakers]
+        digest = inputs_digest(
+            {"session": session, "template": media_template},
+            [media_template, self.fonts["regular"], self.fonts["bold"]] + avatar_files)
+        if not self.force and self.manifest.is_current(session_id, digest) and os.path.exists(output_file):
+            self.render_summary["skipped"] += 1
+            return False
 
-            if self._verbose:
-                print("Generating image for {}...".format(session_id))
-                print(session)
+        if self._verbose:
+            print("Generating image for {}...".format(session_id))
+            print(session)
 
 
-            # tracks = tracks.replace(";",", ")
-            # tracks.rsplit(", ")[0]
-            # tracks_list = tracks.split(",")
+        # tracks = tracks.replace(";",", ")
+        # tracks.rsplit(", ")[0]
+        # tracks_list = tracks.split(",")
 
 
-            # speaker_emails = speakers.split(",")
-            # # Collect speaker info for each email in speaker_emails
-            # speaker_list = []
-            # for email in speaker_emails:
-            #     for user in self._users_data:
-            #         if email == user["speaker_email"]:
-            #             speaker_list.append(user)
+        # speaker_emails = speakers.split(",")
+        # # Collect speaker info for each email in speaker_emails
+        # speaker_list = []
+        # for email in speaker_emails:
+        #     for user in self._users_data:
+        #         if email == user["speaker_email"]:
+        #             speaker_list.append(user)
 
 
-            # Check to see if the length of the speakers array is greater than 1
-            # If length is 1 then create a circular thumbnail and paste on background image
-            if speakers:
-                # Create circlar thumbnail
-                circle_thumb = self.create_circle_thumbnail(self._photos_path + speakers[0]["speaker_image"])
-            else:
-                circle_thumb = False
-            # Open the media template e.g YVR18 placeholder background
-            background_image = Image.open(media_template).convert("RGBA")
-            # If Circular thumbnail exists then past on background
-            if circle_thumb:
-                background_image.paste(circle_thumb, self.photo_offset, circle_thumb)
-            # Get the draw object from ImageDraw.Draw() method
-            background_image_draw = ImageDraw.Draw(background_image)
-            # Check if the media_template is a valid type specified in self.types
-            if media_template in self._types:
-                if media_template == self._types[0]:
-                    # Collect string with all speakers and job titles.
-                    names_of_speakers = ""
-                    # Count the number of speakers
-                    speaker_count = 0
-                    for speaker in session['session_speakers']:
-                        speaker_name_string = speaker["speaker_name"]
-                        if speaker["speaker_position"]:
-                            speaker_name_string = speaker_name_string + ", " + speaker["speaker_position"]
-                            if speaker["speaker_company"]:
-                                speaker_name_string = speaker_name_string + " at " + speaker["speaker_company"]
-                        elif len(speaker["speaker_company"]) > 2:
+        # Check to see if the length of the speakers array is greater than 1
+        # If length is 1 then create a circular thumbnail and paste on background image
+        if speakers:
+            # Create circlar thumbnail
+            circle_thumb = self.create_circle_thumbnail(self._photos_path + speakers[0]["speaker_image"])
+        else:
+            circle_thumb = False
+        # Get a copy of the decoded media template e.g YVR18 placeholder background
+        background_image = self.template_cache.get_template(media_template)
+        # If Circular thumbnail exists then past on background
+        if circle_thumb:
+            background_image.paste(circle_thumb, self.photo_offset, circle_thumb)
+        # Get the draw object from ImageDraw.Draw() method
+        background_image_draw = ImageDraw.Draw(background_image)
+        # Check if the media_template is a valid type specified in self.types
+        if media_template in self._types:
+            if media_template == self._types[0]:
+                # Collect string with all speakers and job titles.
+                names_of_speakers = ""
+                # Count the number of speakers
+                speaker_count = 0
+                for speaker in session['session_speakers']:
+                    speaker_name_string = speaker["speaker_name"]
+                    if speaker["speaker_position"]:
+                        speaker_name_string = speaker_name_string + ", " + speaker["speaker_position"]
+                        if speaker["speaker_company"]:
                             speaker_name_string = speaker_name_string + " at " + speaker["speaker_company"]
+                    elif len(speaker["speaker_company"]) > 2:
+                        speaker_name_string = speaker_name_string + " at " + speaker["speaker_company"]
+
+                    names_of_speakers = names_of_speakers +  "{0}, ".format(speaker_name_string)
+                    speaker_count += 1
+                print(names_of_speakers)
+                # print("Not Split: ", names_of_speakers)
+                if names_of_speakers.endswith(', '):
+                    names_of_speakers = names_of_speakers[:-2]
+                # print("Split: ", names_of_speakers)
+                # Write the names to the background image
+                if len(names_of_speakers) > 30:
+                    background_image_draw = self.write_text(background_image_draw, names_of_speakers,[[920,970],400], 22, self.fonts["regular"], self.colours["white"], centered=True, multiline=True)
+                else:
+                    background_image_draw = self.write_text(background_image_draw, names_of_speakers,[[920,970],400], 22, self.fonts["regular"], self.colours["white"], centered=True, multiline=True)
+
+                # Add the session ID to the background image
+                if "SAN19" in session_id:
+                    background_image_draw = self.write_text(background_image_draw, session_id,[80, 340],48, self.fonts["bold"], self.colours["white"], centered=False, multiline=False)
 
-                        names_of_speakers = names_of_speakers +  "{0}, ".format(speaker_name_string)
-                        speaker_count += 1
-                    print(names_of_speakers)
-                    # print("Not Split: ", names_of_speakers)
-                    if names_of_speakers.endswith(', '):
-                        names_of_speakers = names_of_speakers[:-2]
-                    # print("Split: ", names_of_speakers)
-                    # Write the names to the background image
-                    if len(names_of_speakers) > 30:
-                        background_image_draw = self.write_text(background_image_draw, names_of_speakers,[[920,970],400], 22, self.fonts["regular"], self.colours["white"], centered=True, multiline=True)
-                    else:
-                        background_image_draw = self.write_text(background_image_draw, names_of_speakers,[[920,970],400], 22, self.fonts["regular"], self.colours["white"], centered=True, multiline=True)
-
-                    # Add the session ID to the background image
-                    if "SAN19" in session_id:
-                        background_image_draw = self.write_text(background_image_draw, session_id,[80, 340],48, self.fonts["bold"], self.colours["white"], centered=False, multiline=False)
-
-                    # Add the tracks
-                    background_image_draw = self.write_text(background_image_draw, tracks[0],[80,400],28, self.fonts["bold"], self.colours["white"], centered=False, multiline=False)
-
-                    # Add the title to the background image
-                    if len(title) < 40:
-                        background_image_draw = self.write_text(background_image_draw, title,[80,440],48, self.fonts["bold"], self.colours["white"], centered=False, multiline=True)
-                    else:
-                        background_image_draw = self.write_text(background_image_draw, title,[80,440],44, self.fonts["bold"], self.colours["white"], centered=False, multiline=True)
-
-                    # Create the output file name from the session_id and the output_path
-                    output_file = self.output_path + session_id + ".png"
-                    if self._verbose:
-                        print(output_file)
-                    # Write the output file
-                    background_image.save(output_file, quality=100, format="png")
+                # Add the tracks
+                background_image_draw = self.write_text(background_image_draw, tracks[0],[80,400],28, self.fonts["bold"], self.colours["white"], centered=False, multiline=False)
+
+                # Add the title to the background image
+                if len(title) < 40:
+                    background_image_draw = self.write_text(background_image_draw, title,[80,440],48, self.fonts["bold"], self.colours["white"], centered=False, multiline=True)
                 else:
-                    print("media_tempalte not in self._types")
-            else:
-                print("No media template")
+                    background_image_draw = self.write_text(background_image_draw, title,[80,440],44, self.fonts["bold"], self.colours["white"], centered=False, multiline=True)
 
+                if self._verbose:
+                    print(output_file)
+                # Write the output file
+                self.writer.submit(self.write_image, background_image, output_file, session_id, digest)
+            else:
+                print("media_tempalte not in self._types")
+                background_image.close()
+        else:
+            print("No media template")
+            background_image.close()
         return True
 
+    def write_image(self, image, output_file, session_id, digest):
+        """Encodes and writes an image, recording it in the manifest"""
+        try:
+            data = self.encoder.encode(image)
+        finally:
+            # Release the canvas as soon as it is encoded
+            image.close()
+        with open(output_file, "wb") as f:
+            f.write(data)
+        self.manifest.record(session_id, digest)
+        self.render_summary["rendered"] += 1
+
 
     def create_circle_thumbnail(self, file_name):
         """Creates a ciruclar thumbnail given a file name of an image"""
-        # Open the speaker image to generate the circular thumb.
-        image_obj = Image.open(file_name).convert("RGBA")
-        # Create a circle thumbnail file name
-        circle_thumbnail_file_name = '{0}-{1}.png'.format(file_name,"circle")
-        # Create a new circle thumb mask
-        mask = Image.new('L', self.circle_thumb_size, 0)
-        # Instantiate Draw() for mask.
-        draw = ImageDraw.Draw(mask)
-        # Draw a circle with set size and fill.
-        draw.ellipse((0, 0) + self.circle_thumb_size, fill=255)
-        # Fit the image to the mask
-        circle_thumbnail = ImageOps.fit(image_obj, mask.size, centering=(0.5, 0.5))
-        circle_thumbnail.putalpha(mask)
-        circle_thumbnail.save(circle_thumbnail_file_name, format="png")
-        circle_thumb = Image.open(circle_thumbnail_file_name)
+        # Get the circular thumb from the thumbnail cache, cropping it on first use.
+        circle_thumb = circle_thumbnail(file_name, self.circle_thumb_size, self.normalized_avatars_path)
+        if self.save_thumbnails:
+            # Create a circle thumbnail file name
+            circle_thumbnail_file_name = '{0}-{1}.png'.format(file_name,"circle")
+            circle_thumb.save(circle_thumbnail_file_name, format="png")
         # Return the circular thumbnail
         return circle_thumb
 
@@ -555,4 +691,10 @@ class SocialMediaImageAutomation:
 if __name__ == "__main__":
 
     # Instantiate the class with parameters of your choice
-    socailMediaImages = SocialMediaImageAutomation(["san19-placeholder.jpg"], using_api=True)
+    parser = argparse.ArgumentParser(description="Generate social media images for a Sched.com event.")
+    parser.add_argument("--force", action="store_true", help="Re-render every image even if its inputs are unchanged.")
+    parser.add_argument("--offline", action="store_true", help="Render from the local copy of the Sched.com data without syncing it.")
+    parser.add_argument("--shard", help="Only render the sessions in shard i of N, written as i/N.")
+    parser.add_argument("--merge-shards", type=int, metavar="N", help="Combine the manifests of N shards and check they cover every session.")
+    args = parser.parse_args()
+    socailMediaImages = SocialMediaImageAutomation(["san19-placeholder.jpg"], using_api=True, force=args.force, offline=args.offline, shard=args.shard, merge_shards=args.merge_shards)
@@ -24,5 +24,10 @@ setup(
     author_email='kyle.kirkby@linaro.org',
     url='https://github.com/linaro-marketing/SocialMediaImageGenerator',
     license=license,
-    packages=find_packages(exclude=('tests', 'docs'))
+    packages=find_packages(exclude=('tests', 'docs')),
+    # Lazy package imports (PEP 562) and ThreadingHTTPServer need Python 3.7
+    python_requires='>=3.7',
+    entry_points={
+        'console_scripts': ['social-image-generator=social_image_generator.cli:main'],
+    }
 )
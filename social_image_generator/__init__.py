@@ -1 +1,52 @@
-from .core import *
+"""
+Create social media share images from a template, text and embedded images.
+
+Names are imported from their submodules on first use so that importing the
+package, e.g. to render, does not load the networking and data source modules.
+"""
+import importlib
+
+# Public name -> submodule it is defined in
+_exports = {
+    "core": ["RenderResult", "SocialImageGenerator"],
+    "cache": ["LRUCache", "FontCache", "TemplateCache", "SingleFlight", "image_bytes", "load_rgba",
+              "font_cache", "get_font"],
+    "thumbnails": ["ROTATED_ORIENTATIONS", "mask_cache", "digest_cache", "thumbnail_cache", "file_digest",
+                   "circle_mask", "load_fitted", "normalized_avatar", "circle_thumbnail"],
+    "download": ["DownloadResult", "Downloader"],
+    "avatars": ["AvatarStore"],
+    "manifest": ["inputs_digest", "RenderManifest"],
+    "text_layout": ["layout_cache", "layout_text", "text_run_cache", "text_run", "draw_text_run"],
+    "layout": ["RenderJob", "is_true", "TextSlot", "ImageSlot", "Layout", "compile_text", "compile_image",
+               "compile_layout"],
+    "sinks": ["Sink", "DirectorySink", "MemorySink", "TarSink", "ZipSink"],
+    "presets": ["Preset", "PRESETS", "fit_preset", "preset_images"],
+    "encoders": ["Encoder", "BackgroundWriter"],
+    "metrics": ["Metrics", "NullMetrics", "peak_rss_mb"],
+    "pipeline": ["run_pipeline"],
+    "store": ["SchedStore"],
+    "config": ["get_sched_api_key"],
+    "records": ["SESSION_COLUMNS", "USER_COLUMNS", "read_records", "read_sessions", "read_users",
+                "sched_session", "read_sched_sessions"],
+    "users": ["normalize_name", "UserDirectory"],
+    "server": ["RenderService", "RenderRequestHandler", "make_server", "serve"],
+    "shards": ["parse_shard", "shard_index", "in_shard", "shard_manifest_path", "record_assigned",
+               "merge_shard_manifests"],
+}
+
+_modules = {name: module for module, names in _exports.items() for name in names}
+
+__all__ = sorted(_modules)
+
+
+def __getattr__(name):
+    """Imports a public name from its submodule the first time it is used"""
+    if name not in _modules:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + _modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
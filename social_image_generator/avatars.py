@@ -0,0 +1,148 @@
+from .cache import SingleFlight
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+class AvatarStore:
+    """
+    Persistent content addressed store of downloaded avatars.
+
+    Each url maps to the sha256 of its body along with the ETag and Last-Modified
+    headers it was served with. Bodies are kept once under blobs/<sha256> however many
+    urls point at them. Urls seen again are revalidated with a conditional request so
+    an unchanged avatar costs a 304 and no body transfer, and a url is only revalidated
+    once per run.
+    """
+
+    def __init__(self, directory, max_age=30 * 24 * 60 * 60, max_bytes=512 * 1024 * 1024):
+        if not directory.endswith("/"):
+            directory += "/"
+        self.directory = directory
+        self.blobs_path = directory + "blobs/"
+        self.index_path = directory + "index.json"
+        # Entries unused for longer than max_age seconds are evicted
+        self.max_age = max_age
+        # Blobs are evicted least recently used first above max_bytes
+        self.max_bytes = max_bytes
+        if not os.path.exists(self.blobs_path):
+            os.makedirs(self.blobs_path)
+        self._index = self._load_index()
+        # Urls already fetched or revalidated during this run
+        self._fresh = set()
+        self._in_flight = SingleFlight()
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        """Loads the url index from disk, starting empty if it is missing or corrupt"""
+        try:
+            with open(self.index_path, "rt", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def blob_path(self, digest):
+        """Returns the path of the blob holding the content with the given digest"""
+        return self.blobs_path + digest
+
+    def fetch(self, session, url, timeout=None):
+        """
+        Returns (blob path, status) for url, downloading or revalidating it if needed.
+        Concurrent fetches of the same url share a single request.
+        """
+        return self._in_flight.do(url, lambda: self._fetch(session, url, timeout))
+
+    def _fetch(self, session, url, timeout):
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is not None and not os.path.exists(self.blob_path(entry["digest"])):
+                entry = None
+            if entry is not None and url in self._fresh:
+                entry["used_at"] = time.time()
+                return self.blob_path(entry["digest"]), "cached"
+        # Revalidate what we already have with a conditional request
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            if resp.status_code == 304 and entry is not None:
+                # Not modified, keep the validators we already had unless new ones were sent
+                previous = entry
+                digest = entry["digest"]
+            else:
+                resp.raise_for_status()
+                previous = {}
+                digest = self._write_blob(resp)
+            now = time.time()
+            with self._lock:
+                self._index[url] = {
+                    "digest": digest,
+                    "etag": resp.headers.get("ETag", previous.get("etag")),
+                    "last_modified": resp.headers.get("Last-Modified", previous.get("last_modified")),
+                    "size": os.path.getsize(self.blob_path(digest)),
+                    "fetched_at": now,
+                    "used_at": now
+                }
+                self._fresh.add(url)
+            return self.blob_path(digest), resp.status_code
+
+    def _write_blob(self, resp):
+        """Streams a response body into the store, returning its sha256"""
+        digest = hashlib.sha256()
+        temp_path = "{0}tmp-{1}-{2}".format(self.blobs_path, os.getpid(), threading.get_ident())
+        with open(temp_path, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                digest.update(chunk)
+                f.write(chunk)
+        digest = digest.hexdigest()
+        os.replace(temp_path, self.blob_path(digest))
+        return digest
+
+    def materialize(self, blob_path, path):
+        """Places the blob at path, leaving path alone if it already holds that content"""
+        if os.path.exists(path) and os.path.samefile(blob_path, path):
+            return False
+        temp_path = "{0}.{1}-{2}.part".format(path, os.getpid(), threading.get_ident())
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(blob_path, temp_path)
+        except OSError:
+            shutil.copyfile(blob_path, temp_path)
+        os.replace(temp_path, path)
+        return True
+
+    def evict(self):
+        """Drops entries past max_age then least recently used blobs above max_bytes"""
+        with self._lock:
+            now = time.time()
+            for url in list(self._index):
+                if now - self._index[url]["used_at"] > self.max_age:
+                    del self._index[url]
+            # Sum the size of each blob once, dropping the oldest urls while over budget
+            by_use = sorted(self._index.items(), key=lambda item: item[1]["used_at"], reverse=True)
+            sizes = {}
+            for url, entry in by_use:
+                if entry["digest"] not in sizes and sum(sizes.values()) + entry["size"] > self.max_bytes:
+                    del self._index[url]
+                else:
+                    sizes[entry["digest"]] = entry["size"]
+            # Remove blobs no url refers to anymore
+            for blob in os.listdir(self.blobs_path):
+                if blob not in sizes and not blob.startswith("tmp-"):
+                    os.remove(self.blob_path(blob))
+
+    def save(self):
+        """Evicts stale entries and writes the url index to disk"""
+        self.evict()
+        with self._lock:
+            temp_path = self.index_path + ".part"
+            with open(temp_path, "wt", encoding="utf8") as f:
+                json.dump(self._index, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.index_path)
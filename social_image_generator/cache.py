@@ -0,0 +1,201 @@
+from PIL import Image
+from PIL import ImageFont
+from collections import OrderedDict
+from concurrent import futures
+import os
+import threading
+
+
+class LRUCache:
+    """
+    A small thread safe least recently used cache with hit/miss counters.
+    """
+
+    def __init__(self, maxsize=128, max_weight=None, weigher=None):
+        self.maxsize = maxsize
+        # Optional upper bound on the summed weight (e.g. bytes) of the entries
+        self.max_weight = max_weight
+        self._weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._weights = {}
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, marking it as recently used"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently used entries if full"""
+        with self._lock:
+            if key in self._data:
+                self.pop(key)
+            self._data[key] = value
+            if self._weigher is not None:
+                self._weights[key] = self._weigher(value)
+                self.weight += self._weights[key]
+            self._evict()
+
+    def pop(self, key, default=None):
+        """Removes key from the cache and returns its value"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            self.weight -= self._weights.pop(key, 0)
+            return self._data.pop(key)
+
+    def _evict(self):
+        """Drops least recently used entries until within maxsize and max_weight"""
+        while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight and len(self._data) > 1):
+            key = next(iter(self._data))
+            self.pop(key)
+            self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for key or builds it with factory()"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            value = factory()
+            self.put(key, value)
+            return value
+
+    def clear(self):
+        """Empties the cache and resets the counters"""
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self.weight = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Returns a dictionary of the cache counters"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "weight": self.weight,
+                "max_weight": self.max_weight
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class FontCache(LRUCache):
+    """
+    Process wide registry of ImageFont objects keyed by resolved font path and size.
+    """
+
+    def get_font(self, font_family, font_size):
+        """Returns a FreeTypeFont for the font file and size, loading it once"""
+        font_path = os.path.realpath(font_family)
+        font_size = int(font_size)
+        return self.get_or_create(
+            (font_path, font_size),
+            lambda: ImageFont.truetype(font_path, font_size))
+
+
+class TemplateCache(LRUCache):
+    """
+    Keeps decoded RGBA template images in memory keyed by path and modification time.
+    Each render receives a copy so the cached base is never drawn on.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, maxsize=32):
+        super().__init__(maxsize=maxsize, max_weight=max_bytes, weigher=image_bytes)
+        # Maps resolved path to the (path, mtime) key currently cached for it
+        self._current_keys = {}
+
+    def get_template(self, template):
+        """Returns a fresh RGBA copy of the decoded template"""
+        template_path = os.path.realpath(template)
+        key = (template_path, os.stat(template_path).st_mtime_ns)
+        with self._lock:
+            # Drop a stale decode if the template changed on disk
+            previous_key = self._current_keys.get(template_path)
+            if previous_key is not None and previous_key != key:
+                self.pop(previous_key)
+            self._current_keys[template_path] = key
+            base = self.get_or_create(key, lambda: load_rgba(template_path))
+        return base.copy()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if self._current_keys.get(key[0]) == key:
+                del self._current_keys[key[0]]
+            return super().pop(key, default)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key so the work runs only once.
+    Callers arriving while a call is in flight wait for and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Runs fn() for key unless a call for key is already running, returning its result"""
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = futures.Future()
+                self._calls[key] = future
+        if not owner:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def image_bytes(image):
+    """Returns the approximate in-memory size of a PIL image in bytes"""
+    return image.width * image.height * len(image.getbands())
+
+
+def load_rgba(file_name):
+    """Decodes an image file fully into an RGBA image and closes the file"""
+    with Image.open(file_name) as image_obj:
+        return image_obj.convert("RGBA")
+
+
+# Shared font cache used by every renderer in the process
+font_cache = FontCache(maxsize=64)
+
+
+def get_font(font_family, font_size):
+    """Returns a cached FreeTypeFont from the shared font cache"""
+    return font_cache.get_font(font_family, font_size)
@@ -0,0 +1,141 @@
+"""
+Command line renderer:
+
+    python -m social_image_generator images.json --output output --assets assets
+
+The options file holds a JSON options dictionary, a JSON list of them or one per
+line (JSON Lines), each with a "file_name" and the usual "template" and "elements".
+Use - to read the options from stdin. JSON Lines are recognised by a .jsonl name,
+--jsonl or a first line holding a whole options dictionary, and are read as the
+images are rendered.
+"""
+import argparse
+import itertools
+import json
+import sys
+
+
+def read_options(path, jsonl=False):
+    """
+    Yields the options dictionaries in a JSON or JSON Lines file, - for stdin, the
+    lines of JSON Lines read one at a time. Raises ValueError naming the line of any
+    malformed input.
+    """
+    if path == "-":
+        f = sys.stdin
+        name = "<stdin>"
+    else:
+        f = open(path, "rt", encoding="utf8")
+        name = path
+    try:
+        # Find the first line with content, telling JSON Lines from JSON by it
+        first = None
+        for number, first in enumerate(f, 1):
+            if first.strip():
+                break
+        else:
+            return
+        jsonl = jsonl or path.endswith(".jsonl")
+        if not jsonl:
+            try:
+                jsonl = isinstance(json.loads(first), dict)
+            except ValueError:
+                jsonl = False
+        if jsonl:
+            for number, line in enumerate(itertools.chain([first], f), number):
+                if line.strip():
+                    yield _parse_options(line, name, number)
+            return
+        try:
+            options = json.loads(first + f.read())
+        except ValueError as e:
+            raise ValueError("{0} line {1}: {2}".format(name, e.lineno + number - 1, e.msg))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if isinstance(options, dict):
+        options = [options]
+    elif not isinstance(options, list):
+        raise ValueError("{0}: expected an options dictionary or a list of them".format(name))
+    for index, item in enumerate(options):
+        if not isinstance(item, dict):
+            raise ValueError("{0}: item {1} is not an options dictionary".format(name, index))
+        yield item
+
+
+def _parse_options(line, name, number):
+    """Returns the options dictionary on a line of JSON Lines"""
+    try:
+        options = json.loads(line)
+    except ValueError as e:
+        raise ValueError("{0} line {1}: {2}".format(name, number, e.msg))
+    if not isinstance(options, dict):
+        raise ValueError("{0} line {1}: expected an options dictionary".format(name, number))
+    return options
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m social_image_generator",
+        description="Render social media images from a JSON or JSON Lines options file.")
+    parser.add_argument("options", help="JSON or JSON Lines (.jsonl) options file, - for stdin.")
+    parser.add_argument("--jsonl", action="store_true", help="Read the options file as JSON Lines.")
+    parser.add_argument("--output", default="output", help="Directory the images are written to.")
+    parser.add_argument("--assets", default=None, help="Assets directory holding the fonts and images.")
+    parser.add_argument("--template", default=None, help="Template used by options without one.")
+    parser.add_argument("--format", default=None, choices=["png", "jpeg", "webp"], help="Output format.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of render processes, 0 for the CPU count. Defaults to 1.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip images already rendered from identical inputs.")
+    parser.add_argument("--force", action="store_true", help="Re-render images even if unchanged.")
+    parser.add_argument("--shard", default=None, help="Only render shard i of N, written as i/N.")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Most images rendered but not yet written at once. Defaults to 4 per worker.")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MB",
+                        help="Size the images in flight to fit this many MiB instead of --max-in-flight.")
+    parser.add_argument("--metrics-file", default=None, help="Write stage timings and counters as JSON here.")
+    parser.add_argument("--quiet", action="store_true", help="Only print errors.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Renders every options dictionary in the options file, returning the exit status:
+    1 if any image failed, 2 if the options could not be read.
+    """
+    args = parse_args(argv)
+    # Imported here so --help answers without loading Pillow
+    from .core import SocialImageGenerator
+    settings = {"output": args.output, "incremental": args.incremental}
+    if args.assets:
+        settings["assets_path"] = args.assets
+    if args.template:
+        settings["template"] = args.template
+    if args.format:
+        settings["encoder"] = {"format": args.format}
+    if args.shard:
+        settings["shard"] = args.shard
+    if args.max_in_flight:
+        settings["max_in_flight"] = args.max_in_flight
+    if args.memory_budget:
+        settings["memory_budget"] = args.memory_budget * 1024 * 1024
+    if args.metrics_file:
+        settings["metrics_file"] = args.metrics_file
+    generator = SocialImageGenerator(settings)
+    generator._verbose = not args.quiet
+    results = generator.create_images(
+        read_options(args.options, args.jsonl), workers=args.workers or None, force=args.force)
+    failed = 0
+    try:
+        for result in results:
+            if result.error:
+                failed += 1
+                print("Failed to generate {0}:\n{1}".format(result.file_name, result.error), file=sys.stderr)
+    except (OSError, ValueError) as e:
+        # Malformed or unreadable options, found as the batch reads them
+        print("Cannot read the options: {0}".format(e), file=sys.stderr)
+        return 2
+    if not args.quiet:
+        print("Rendered: {rendered}, Skipped: {skipped}, Failed: {failed}, Peak RSS: {peak_rss_mb} MiB (workers {worker_peak_rss_mb} MiB)".format(**generator.render_summary))
+    return 1 if failed else 0
@@ -0,0 +1,16 @@
+import os
+
+
+def get_sched_api_key():
+    """
+    Returns the Sched.com API key from the SCHED_API_KEY environment variable,
+    falling back to SCHED_API_KEY in a secrets.py on the import path, or None if
+    neither is set
+    """
+    if os.environ.get("SCHED_API_KEY"):
+        return os.environ["SCHED_API_KEY"]
+    try:
+        from secrets import SCHED_API_KEY
+    except ImportError:
+        return None
+    return SCHED_API_KEY
@@ -1,17 +1,45 @@
 from PIL import Image
-from PIL import ImageFont
 from PIL import ImageDraw
-from PIL import ImageOps
-from urllib import request
-import requests
-import io
-import textwrap
-import csv
 import os
-import pickle
-import ast
-import re
 from urllib.parse import urlparse
+from collections import deque
+from collections import namedtuple
+from concurrent import futures
+import itertools
+import traceback
+from .cache import TemplateCache
+from .thumbnails import circle_thumbnail
+from .text_layout import draw_text_run
+from .text_layout import layout_text
+from .layout import RenderJob
+from .layout import TextSlot
+from .layout import compile_image
+from .layout import compile_layout
+from .layout import compile_text
+from .manifest import RenderManifest
+from .manifest import inputs_digest
+from .sinks import DirectorySink
+from .presets import PRESETS
+from .presets import preset_images
+from .encoders import BackgroundWriter
+from .encoders import Encoder
+from .shards import in_shard
+from .shards import merge_shard_manifests
+from .shards import parse_shard
+from .shards import record_assigned
+from .shards import shard_manifest_path
+from .metrics import Metrics
+from .metrics import NullMetrics
+from .metrics import peak_rss_mb
+from .cache import font_cache
+from .text_layout import layout_cache
+from .text_layout import text_run_cache
+from .thumbnails import mask_cache
+from .thumbnails import thumbnail_cache
+
+
+# Outcome of rendering one options dictionary in a batch
+RenderResult = namedtuple("RenderResult", ["index", "file_name", "output_file", "error", "skipped"])
 
 
 class SocialImageGenerator:
@@ -21,6 +49,8 @@ class SocialImageGenerator:
 
     def __init__(self, options):
         self._verbose = True  # Verbose Setting
+        # Keep the settings so batch workers can build an identical generator
+        self._options = options
         # Set the output path
         if options["output"]:
             if options["output"].endswith("/"):
@@ -32,6 +62,18 @@ class SocialImageGenerator:
         # Check to see if the output path exists and create if not
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
+        # Images are written to the output path unless another sink is given
+        self.sink = DirectorySink(self.output_path)
+        # Set the output format and encoder settings e.g {"format": "png", "compress_level": 9}
+        if "encoder" in options:
+            self.encoder = Encoder(**options["encoder"])
+        else:
+            self.encoder = Encoder()
+        # Set the number of threads encoding and writing images in the background
+        if "background_encoding" in options and int(options["background_encoding"]) > 0:
+            self.writer = BackgroundWriter(max_workers=int(options["background_encoding"]))
+        else:
+            self.writer = None
         # Set the template
         if "template" in options:
             self.template = options["template"]
@@ -46,6 +88,17 @@ class SocialImageGenerator:
             self._assets_path = assets_path
         else:
             self._assets_path = os.getcwd() + "/assets/"
+        # Set the memory cap for decoded templates kept between renders
+        if "template_cache_bytes" in options:
+            template_cache_bytes = int(options["template_cache_bytes"])
+        else:
+            template_cache_bytes = 256 * 1024 * 1024
+        self.template_cache = TemplateCache(max_bytes=template_cache_bytes)
+        # Set whether circle thumbnails are also written to disk
+        if "save_thumbnails" in options:
+            self.save_thumbnails = options["save_thumbnails"] == "True" or options["save_thumbnails"] is True
+        else:
+            self.save_thumbnails = False
 
         # Defaults
         self.defaults = {
@@ -57,6 +110,63 @@ class SocialImageGenerator:
             }
         }
 
+        # Set the slice of each batch this generator renders e.g "2/4" for the second of four shards
+        if "shard" in options and options["shard"]:
+            self.shard = parse_shard(options["shard"])
+        else:
+            self.shard = None
+        # Set whether unchanged images are skipped using a manifest beside the output directory.
+        # Each shard keeps its own manifest, combined afterwards with merge_shard_manifests.
+        self.manifest_path = self.output_path.rstrip("/") + ".manifest.json"
+        if self.shard is not None:
+            self.manifest_path = shard_manifest_path(self.manifest_path, self.shard)
+        self.incremental = "incremental" in options and (
+            options["incremental"] == "True" or options["incremental"] is True)
+        if self.incremental or self.shard is not None:
+            self.manifest = RenderManifest(self.manifest_path)
+        else:
+            self.manifest = None
+        # Counts of images rendered, skipped and failed by this generator
+        self.render_summary = {"rendered": 0, "skipped": 0, "failed": 0,
+                               "peak_rss_mb": None, "worker_peak_rss_mb": None}
+        # Set the persistent avatar cache directory, if any
+        if "avatar_cache" in options:
+            self.avatar_cache_path = options["avatar_cache"]
+        else:
+            self.avatar_cache_path = None
+        # Set the directory upright, right sized copies of embedded photos are kept in, if any
+        if "normalized_avatars" in options and options["normalized_avatars"]:
+            self.normalized_avatars_path = options["normalized_avatars"]
+        else:
+            self.normalized_avatars_path = None
+        # Set the most batch items submitted to worker processes but not yet written, given
+        # directly or as a memory budget in bytes for the canvases and encoded images
+        if "max_in_flight" in options and options["max_in_flight"]:
+            self.max_in_flight = int(options["max_in_flight"])
+        else:
+            self.max_in_flight = None
+        if "memory_budget" in options and options["memory_budget"]:
+            self.memory_budget = int(options["memory_budget"])
+        else:
+            self.memory_budget = None
+        # Set whether stage timings and counters are collected, and the file a JSON
+        # summary is written to at the end of each batch
+        if "metrics_file" in options and options["metrics_file"]:
+            self.metrics_file = options["metrics_file"]
+        else:
+            self.metrics_file = None
+        if self.metrics_file or ("metrics" in options and (options["metrics"] == "True" or options["metrics"] is True)):
+            self.metrics = Metrics()
+            self.metrics.add_cache("font", font_cache)
+            self.metrics.add_cache("layout", layout_cache)
+            self.metrics.add_cache("text_run", text_run_cache)
+            self.metrics.add_cache("mask", mask_cache)
+            self.metrics.add_cache("thumbnail", thumbnail_cache)
+            self.metrics.add_cache("template", self.template_cache)
+        else:
+            self.metrics = NullMetrics()
+        # Pooled photo downloader, created on first use
+        self._downloader = None
         # Youtube Thumbnail Image URl
         self.youtube_thumbnail_image = "https://img.youtube.com/vi/{0}/sddefault.jpg"
         # Circle Thumbnail Size
@@ -73,8 +183,21 @@ class SocialImageGenerator:
                         "grey": (153, 153, 153),
                         "linaro-blue": (70, 145, 218)}
 
-    def grab_photo(self, url, output_filename, output_path="images/"):
-        """Fetches attendee photo from the pathable data"""
+    @property
+    def downloader(self):
+        """Returns the pooled Downloader used to fetch photos, creating it on first use"""
+        if self._downloader is None:
+            # Imported here so rendering never loads requests
+            from .download import Downloader
+            from .avatars import AvatarStore
+            if self.avatar_cache_path:
+                self._downloader = Downloader(store=AvatarStore(self.avatar_cache_path), metrics=self.metrics)
+            else:
+                self._downloader = Downloader(metrics=self.metrics)
+        return self._downloader
+
+    def _photo_path(self, url, output_filename, output_path):
+        """Returns the file name and full output path for a downloaded photo"""
         # Get the filename parsed in
         file_name = output_filename
         # Extract the path from the URL
@@ -88,183 +211,508 @@ class SocialImageGenerator:
         output_folder_path = self.output_path + output_path
         if not os.path.exists(output_folder_path):
             os.makedirs(output_folder_path)
-        output = output_folder_path + file_name + ext
-        # Try to download the image and Except errors and return as false.
-        try:
-            opener = request.build_opener()
-            opener.addheaders = [('User-agent', 'Mozilla/5.0')]
-            request.install_opener(opener)
-            request.urlretrieve(url, output)
-        except Exception as e:
-            print(e)
-            image = False
-        return(file_name + ext)
+        return file_name + ext, output_folder_path + file_name + ext
 
+    def grab_photo(self, url, output_filename, output_path="images/"):
+        """Fetches attendee photo from the pathable data"""
+        file_name, output = self._photo_path(url, output_filename, output_path)
+        # Try to download the image and print any errors.
+        result = self.downloader.fetch(url, output)
+        if not result.ok:
+            print(result.error)
+        return(file_name)
 
-    def draw_image(self, options):
-        """Adds an image to the social_image_canvas object"""
-
-        if "position" in options:
-            coords = (options["position"]["x"], options["position"]["y"])
-        if "dimensions" in options:
-            dimensions = (options["dimensions"]["x"], options["dimensions"]["y"])
-        if "image_name" in options:
-            image_name = options["image_name"]
-        if "circle" in options:
-            if options["circle"] == "True":
-                circle_thumb = True
+    def grab_photos(self, photos, output_path="images/"):
+        """
+        Fetches many photos concurrently given an iterable of (url, output_filename) pairs.
+        Returns a DownloadResult per pair in input order.
+        """
+        downloads = []
+        for url, output_filename in photos:
+            file_name, output = self._photo_path(url, output_filename, output_path)
+            downloads.append((url, output))
+        return self.downloader.fetch_many(downloads)
 
-        if circle_thumb:
-            image_to_paste = self.create_circle_thumbnail("images/", image_name, dimensions, "circle_thumbs/")
+    def draw_image(self, options):
+        """Returns the image described by an image element options dictionary"""
+        image_slot = compile_image(options)
+        return self._slot_image(image_slot, image_slot.image_name)
 
-        return image_to_paste
+    def _slot_image(self, image_slot, image_name):
+        """Returns the circular thumbnail for an ImageSlot"""
+        with self.metrics.timer("thumbnail"):
+            return self.create_circle_thumbnail("images/", image_name, image_slot.dimensions, "circle_thumbs/")
 
     def draw_text(self, social_image_canvas, options):
 
         """This method draws text to a PIL canvas object and returns the modified canvas"""
 
-        text_multiline = False
-        text_centered = False
-        font_family = self._assets_path + self.defaults["text"]["font"]["family"]
-        font_size = int(self.defaults["text"]["font"]["size"])
-        font_colour = self.colours["white"]
-        wrap_width = 28
-        text = "Text not set"
-
-        # Get the text options
-        if "wrap_width" in options:
-            wrap_width = options["wrap_width"]
-        if "multiline" in options:
-            if options["multiline"] == "True":
-                text_multiline = True
-        if "centered" in options:
-            if options["centered"] == "True":
-                text_centered = True
-        if "font" in options:
-            # Get the font family
-            if "family" in options["font"]:
-                font_family = self._assets_path + options["font"]["family"]
-            # Get the font size
-            if "size" in options["font"]:
-                font_size = int(options["font"]["size"])
-            # Get the Font Colour
-            if "colour" in options["font"]:
-                font_colour = (
-                    int(options["font"]["colour"]["r"]),
-                    int(options["font"]["colour"]["g"]),
-                    int(options["font"]["colour"]["b"])
-                                )
-        if "value" in options:
-            text = options["value"]
-
-        if "position" in options:
-            coords = [options["position"]["x"],int(options["position"]["y"])]
-
-        # Create an ImageFont object
-        # Used to calculate the dimensions of the text based on a specific size and font.
-        image_font = ImageFont.truetype(font_family, font_size)
-
-        # Check to see if the text is centered and if it is get x coords of the centered text
-        if text_centered:
-            # Get the width and height of the text.
-            text_width, text_height = image_font.getsize(str(text))
-            # Fetch x coords passed in.
-            x = int(coords[0][0])
-            x2 = int(coords[0][1])
-            # Calculate the start of the new line.
-            text_x = x + ((x2 - x) - (text_width) / 2)
-        else:
-            text_x = int(coords[0])
+        text_slot = compile_text(options, self._assets_path, self.defaults)
+        return self._draw_text_slot(social_image_canvas, text_slot, text_slot.value)
 
-        # Create a tuple which (x,y) coords needed for the text method.
-        text_coords = (text_x, coords[1])
+    def _draw_text_slot(self, social_image_canvas, text_slot, text):
+        """Draws text for a TextSlot to a PIL canvas object and returns the modified canvas"""
+        with self.metrics.timer("text"):
+            # Get the wrapped and measured lines from the shared layout cache
+            lines = layout_text(text, text_slot.font_family, text_slot.font_size, text_slot.wrap_width,
+                                text_slot.centered, text_slot.multiline, text_slot.box_width)
+            # Paste each line from the shared text run cache, rasterizing it on first use
+            for x_offset, y_offset, line in lines:
+                draw_text_run(social_image_canvas, (text_slot.x + x_offset, text_slot.y + y_offset), line,
+                              text_slot.font_family, text_slot.font_size, text_slot.colour)
 
-        # Check to see if the text we are writing out should be on multiple lines.
-        if text_multiline == False:
-            social_image_canvas.text(
-                text_coords, text, font_colour, font=image_font)
-        else:
-            # Convert the text into multiple lines
-            lines = textwrap.wrap(text, width=wrap_width)
-            line_y = text_coords[1]
-            for line in lines:
-                # Get the width and height of each line.
-                width, height = image_font.getsize(line)
-                # Check to see if the text we are writing needs to be centered too.
-                if text_centered:
-                    # Calculate the width of each line of text in the multline text output
-                    x = coords[0][0]
-                    x2 = coords[0][1]
-                    # Calculate width of each line based on the width of that particular line
-                    text_x = x + ((x2 - x) - (width) / 2)
-                    social_image_canvas.text(
-                        (text_x, line_y), line, font_colour, font=image_font)
+        return social_image_canvas
+
+    def compile_layout(self, options):
+        """
+        Compiles the static part of an options dictionary into a reusable Layout.
+        Elements may name a "slot" in place of their "value" or "image_name" which
+        is then bound per image with Layout.bind(file_name, **values).
+        """
+        return compile_layout(options, self._assets_path, self.defaults, self.template)
+
+    def _job(self, options):
+        """Returns a RenderJob for an options dictionary or an already bound RenderJob"""
+        if isinstance(options, RenderJob):
+            return options
+        return self.compile_layout(options).bind(options["file_name"])
+
+    def create_image(self, options, force=False, sink=None):
+        """
+        Create an image based on an options dictionary or a RenderJob from Layout.bind and
+        write it to sink, the output directory by default. Returns where it was written.
+        In incremental mode the image is skipped if it was already rendered from
+        identical inputs unless force is True. With background encoding the image is
+        encoded and written on another thread. Call flush() after the last image to wait
+        for the writes and save the manifest.
+        """
+        job = self._job(options)
+        if sink is None:
+            sink = self.sink
+        name = job.file_name + self.encoder.extension
+        manifest = self._manifest_for(sink)
+        digest = None
+        if manifest is not None:
+            digest = self.render_digest(job)
+            if self.incremental and not force and manifest.is_current(job.file_name, digest) and sink.exists(name):
+                self.render_summary["skipped"] += 1
+                self.metrics.incr("images_skipped")
+                return sink.location(name)
+        social_image = self.render(job)
+        if self.writer is not None:
+            self.writer.submit(self._write_image, social_image, job.file_name, sink, digest)
+            return sink.location(name)
+        return self._write_image(social_image, job.file_name, sink, digest)
+
+    def _manifest_for(self, sink):
+        """
+        Returns the manifest tracking what sink holds: the output directory's manifest
+        for the output directory and None for any other sink, whose contents it does
+        not describe
+        """
+        if sink is self.sink:
+            return self.manifest
+        return None
+
+    def _write_image(self, social_image, file_name, sink, digest=None):
+        """Encodes and writes a rendered image, recording its digest, if any, in the manifest"""
+        # Write the output file, releasing the canvas as soon as it is encoded
+        output_file = self._write(sink, file_name + self.encoder.extension, self._encode_and_close(social_image))
+        if self._verbose:
+            print(output_file)
+        if digest is not None:
+            self.manifest.record(file_name, digest)
+        self.render_summary["rendered"] += 1
+        self.metrics.incr("images_rendered")
+        return output_file
+
+    def _encode(self, social_image, encoder=None):
+        """Encodes an image with encoder, this generator's encoder by default, timing it"""
+        if encoder is None:
+            encoder = self.encoder
+        with self.metrics.timer("encode"):
+            return encoder.encode(social_image)
+
+    def _encode_and_close(self, social_image, encoder=None):
+        """Encodes an image and then closes it, freeing its pixels"""
+        try:
+            return self._encode(social_image, encoder)
+        finally:
+            social_image.close()
+
+    def _write(self, sink, name, data):
+        """Writes encoded bytes to sink, timing it and counting the bytes written"""
+        with self.metrics.timer("write"):
+            output_file = sink.write(name, data)
+        self.metrics.incr("bytes_written", len(data))
+        return output_file
+
+    def flush(self):
+        """
+        Waits for images queued for background encoding to be written and saves the
+        manifest of the images rendered so far
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def render_bytes(self, options):
+        """Renders an options dictionary or RenderJob and returns the encoded bytes"""
+        return self._encode_and_close(self.render(options))
+
+    def render(self, options):
+        """Renders an options dictionary or RenderJob and returns the PIL image"""
+        job = self._job(options)
+        metrics = self.metrics
+        with metrics.timer("render"):
+            # Create a new image from a copy of the cached template base
+            with metrics.timer("template"):
+                social_image = self.template_cache.get_template(job.layout.template)
+            social_image_canvas = ImageDraw.Draw(social_image)
+            for element in job.layout.elements:
+                if isinstance(element, TextSlot):
+                    social_image_canvas = self._draw_text_slot(
+                        social_image_canvas, element, element.resolve(job.values))
                 else:
-                    social_image_canvas.text(
-                        (text_coords[0], line_y), line, font_colour, font=image_font)
-                line_y += height
+                    new_image = self._slot_image(element, element.resolve(job.values))
+                    with metrics.timer("paste"):
+                        social_image.paste(new_image, element.position, new_image)
+        return social_image
 
-        return social_image_canvas
+    def create_preset_images(self, options, presets=None, sink=None):
+        """
+        Renders an options dictionary or RenderJob once and writes it in each of the
+        named presets (all of PRESETS by default) and their responsive widths, all
+        downscaled from the single composite. Returns a dictionary of preset name to
+        where it was written.
+        """
+        job = self._job(options)
+        if sink is None:
+            sink = self.sink
+        if presets is None:
+            presets = PRESETS.values()
+        presets = [PRESETS[preset] if isinstance(preset, str) else preset for preset in presets]
+        composite = self.render(job)
+        written = {}
+        try:
+            for name, image, format in preset_images(composite, presets):
+                if format == self.encoder.format:
+                    encoder = self.encoder
+                else:
+                    encoder = Encoder(format=format)
+                file_name = "{0}-{1}{2}".format(job.file_name, name, encoder.extension)
+                written[name] = self._write(sink, file_name, self._encode_and_close(image, encoder))
+                if self._verbose:
+                    print(written[name])
+        finally:
+            composite.close()
+        return written
 
-    def create_image(self, options):
-        """Create an image based on an options dictionary"""
-        if "template" in options:
-            template = options["template"]
-        else:
-            template = self.template
-        # Create a new image with the template base
-        social_image = Image.open(template).convert("RGBA")
-        social_image_canvas = ImageDraw.Draw(social_image)
-        for element in options["elements"]:
-            elements = options["elements"][element]
-            if element == "text":
-                for text_element in elements:
-                    social_image_canvas = self.draw_text(
-                        social_image_canvas, text_element)
-            elif element == "images":
-                for image_element in elements:
-                    new_image = self.draw_image(image_element)
-                    social_image.paste(new_image, (image_element["position"]["x"],image_element["position"]["y"]), new_image)
-        # Save the new image
-        output_file = self.output_path + options["file_name"] + ".png"
+    def render_digest(self, options):
+        """
+        Returns a digest of everything an options dictionary or RenderJob renders from:
+        the options, bound values and encoder settings plus the bytes of the template,
+        font files and embedded images.
+        """
+        job = self._job(options)
+        files = [job.layout.template]
+        for element in job.layout.elements:
+            if isinstance(element, TextSlot):
+                files.append(element.font_family)
+            else:
+                files.append(self._image_path("images/", element.resolve(job.values)))
+        return inputs_digest({"options": job.layout.options, "values": job.values,
+                              "encoder": vars(self.encoder)}, files)
+
+    def create_images(self, options_list, workers=None, ordered=True, force=False, sink=None):
+        """
+        Renders an iterable of options dictionaries or RenderJobs across a pool of worker
+        processes and writes them to sink, the output directory by default.
+        Each worker keeps its own warm font, template and thumbnail caches. Yields a
+        RenderResult per item, in input order if ordered is True or as each render
+        completes otherwise. A failing item is reported in RenderResult.error and does
+        not abort the rest of the batch. workers=1 renders in this process. At most
+        max_in_flight items, or as many as fit the memory_budget option, are rendered
+        ahead of the one being written, and the peak RSS of this process and of the
+        workers is kept in render_summary.
+        In incremental mode unchanged items are skipped unless force is True.
+        With a shard set only the items whose file name hashes to that shard are
+        rendered or yielded, and the names assigned to it are kept in its manifest.
+        """
+        if sink is None:
+            sink = self.sink
+        manifest = self._manifest_for(sink)
+        # Items are compiled and digested only as the batch pulls them, so the first
+        # image does not wait for the whole input and memory does not grow with it.
+        digests = {}
+        assigned = []
+        items = self._batch_items(options_list, manifest, force, sink, digests, assigned)
+        try:
+            for result in self._render_batch(items, workers, ordered, sink):
+                digest = digests.pop(result.index, None)
+                if result.skipped:
+                    self.render_summary["skipped"] += 1
+                    self.metrics.incr("images_skipped")
+                elif result.error:
+                    self.render_summary["failed"] += 1
+                    self.metrics.incr("images_failed")
+                else:
+                    self.render_summary["rendered"] += 1
+                    self.metrics.incr("images_rendered")
+                    if manifest is not None:
+                        manifest.record(result.file_name, digest)
+                yield result
+        finally:
+            if manifest is not None:
+                if self.shard is not None:
+                    # Only the names pulled so far if the batch was cut short
+                    record_assigned(manifest, self.shard, assigned)
+                manifest.save()
+            # Peak memory of this process and of the largest batch worker
+            self.render_summary["peak_rss_mb"], self.render_summary["worker_peak_rss_mb"] = peak_rss_mb()
+            if self.metrics_file:
+                self.metrics.write_json(self.metrics_file)
+
+    def _batch_items(self, options_list, manifest, force, sink, digests, assigned):
+        """
+        Yields, in input order, a RenderResult for each item of a batch known without
+        rendering, skipped or with invalid options, and (index, RenderJob) for each
+        item to render. The digest of each item is kept in digests until its result is
+        recorded, and the names assigned to the shard are appended to assigned.
+        """
+        for index, options in enumerate(options_list):
+            if isinstance(options, RenderJob):
+                file_name = options.file_name
+            else:
+                file_name = options.get("file_name")
+            if self.shard is not None:
+                if not in_shard(file_name, self.shard):
+                    continue
+                assigned.append(file_name)
+            try:
+                job = self._job(options)
+                if manifest is not None:
+                    digests[index] = self.render_digest(job)
+            except Exception:
+                yield RenderResult(index, file_name, None, traceback.format_exc(), False)
+                continue
+            if self.incremental and manifest is not None:
+                name = job.file_name + self.encoder.extension
+                if not force and manifest.is_current(job.file_name, digests[index]) and sink.exists(name):
+                    yield RenderResult(index, job.file_name, sink.location(name), None, True)
+                    continue
+            yield index, job
+
+    def merge_shards(self, count, expected=None):
+        """
+        Combines the manifests written by count shards of a batch into the manifest of
+        the output directory, returning a list of any gaps in their coverage of the
+        file names in expected or the names the shards were assigned.
+        """
+        return merge_shard_manifests(self.output_path.rstrip("/") + ".manifest.json", count, expected)
+
+    def _render_batch(self, items, workers, ordered, sink):
+        """Yields the results of the RenderResults and (index, job) pairs of items"""
+        if workers == 1:
+            # Rendering in this process already completes in input order
+            if self.writer is not None:
+                yield from self._render_in_background(items, sink)
+                return
+            for item in items:
+                if isinstance(item, RenderResult):
+                    yield item
+                else:
+                    yield self._render_result(item[0], item[1], sink)[0]
+            return
+        # Workers only render, the manifest is kept by this process. Sinks that cannot
+        # be shared with other processes are written here from the returned bytes.
+        # Workers return their timings and counters with each result to be merged here.
+        worker_options = dict(self._options, incremental=False, shard=None, background_encoding=0,
+                              metrics=self.metrics.enabled, metrics_file=None)
+        worker_sink = sink if sink.shareable else None
+        with futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_render_worker,
+                initargs=(worker_options, self._verbose)) as executor:
+            completed = self._render_in_workers(executor, items, worker_sink, workers, ordered)
+            for result, data, state in completed:
+                yield self._write_result(result, data, sink, state)
+
+    def _max_in_flight(self, workers, job=None):
+        """
+        Returns how many items a batch may have pulled but not yet written: the
+        max_in_flight option, else as many canvases and their encoded bytes of the
+        template of job as fit in the memory_budget option, else four per worker.
+        """
+        if self.max_in_flight:
+            return self.max_in_flight
+        if self.memory_budget and job is not None:
+            # Size the canvas from the template header without decoding it
+            with Image.open(job.layout.template) as template:
+                width, height = template.size
+            return max(1, self.memory_budget // (width * height * 4 * 2))
+        return (workers or os.cpu_count() or 1) * 4
+
+    def _render_in_workers(self, executor, items, sink, workers, ordered):
+        """
+        Yields (result, data, state) for the items of a batch, rendering their jobs in
+        the workers, in input order if ordered is True or as they complete otherwise.
+        Items are pulled only while fewer than max_in_flight are pulled but not yet
+        yielded, so neither the input nor finished images waiting behind a slow one
+        can pile up in memory. The window is sized from the first job to render.
+        """
+        items = iter(items)
+        pending = deque()
+        max_in_flight = self._max_in_flight(workers)
+        sized = False
+
+        def pull():
+            nonlocal max_in_flight, sized
+            while len(pending) < max_in_flight:
+                item = next(items, None)
+                if item is None:
+                    return
+                if isinstance(item, RenderResult):
+                    future = futures.Future()
+                    future.set_result((item, None, None))
+                else:
+                    index, job = item
+                    if not sized:
+                        max_in_flight = self._max_in_flight(workers, job)
+                        sized = True
+                    future = executor.submit(_render_in_worker, index, job, sink)
+                pending.append(future)
+
+        pull()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, not_done = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            # Keep the workers busy while this result is written
+            pull()
+            yield future.result()
+
+    def _render_result(self, index, job, sink):
+        """
+        Renders a single RenderJob, capturing any error in the result. Returns the
+        RenderResult and, if sink is None, the encoded bytes still to be written.
+        """
+        try:
+            data = self.render_bytes(job)
+            if sink is None:
+                return RenderResult(index, job.file_name, None, None, False), data
+            output_file = self._write(sink, job.file_name + self.encoder.extension, data)
+        except Exception:
+            return RenderResult(index, job.file_name, None, traceback.format_exc(), False), None
         if self._verbose:
             print(output_file)
-        # Write the output file
-        social_image.save(
-            output_file, quality=100, format="png")
+        return RenderResult(index, job.file_name, output_file, None, False), None
+
+    def _render_in_background(self, items, sink):
+        """
+        Renders the jobs of items in this thread while the background writer encodes
+        and writes the previous ones. Yields RenderResults in the order of items.
+        """
+        pending = deque()
+        for item in items:
+            if isinstance(item, RenderResult):
+                future = futures.Future()
+                future.set_result(item)
+                pending.append(future)
+                continue
+            index, job = item
+            try:
+                social_image = self.render(job)
+            except Exception:
+                future = futures.Future()
+                future.set_result(RenderResult(index, job.file_name, None, traceback.format_exc(), False))
+            else:
+                future = self.writer.submit(self._encode_result, index, job, social_image, sink)
+            pending.append(future)
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _encode_result(self, index, job, social_image, sink):
+        """Encodes and writes a rendered image, capturing any error in the result"""
+        try:
+            output_file = self._write(sink, job.file_name + self.encoder.extension,
+                                      self._encode_and_close(social_image))
+        except Exception:
+            return RenderResult(index, job.file_name, None, traceback.format_exc(), False)
+        if self._verbose:
+            print(output_file)
+        return RenderResult(index, job.file_name, output_file, None, False)
+
+    def _write_result(self, result, data, sink, state=None):
+        """
+        Merges the metrics returned by a worker and writes the bytes it returned to
+        sink, returning the updated RenderResult
+        """
+        if state is not None:
+            self.metrics.merge(state)
+        if data is None:
+            return result
+        try:
+            output_file = self._write(sink, result.file_name + self.encoder.extension, data)
+        except Exception:
+            return result._replace(error=traceback.format_exc())
+        return result._replace(output_file=output_file)
+
+    def _image_path(self, src_directory, file_name):
+        """
+        Returns the path of an image to embed, placeholder.jpg coming from the assets.
+        Raises ValueError if file_name could reach outside src_directory.
+        """
+        if "/" in file_name or "\\" in file_name or ".." in file_name:
+            raise ValueError("Image name must be a file name, got {!r}".format(file_name))
+        if file_name == "placeholder.jpg":
+            return self._assets_path + "images/" + file_name
+        return self.output_path + src_directory + file_name
 
     def create_circle_thumbnail(self, src_directory, file_name, dimensions, output_directory):
         """Creates a ciruclar thumbnail given a file name of an image"""
-        output_path = self.output_path + output_directory
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-            print("{} created.".format(output_path))
-        if file_name == "placeholder.jpg":
-            full_path = self._assets_path + "images/" + file_name
-        else:
-            full_path = self.output_path + src_directory + file_name
-        output_path += file_name
-        # Open the speaker image to generate the circular thumb.
-        image_obj = Image.open(full_path).convert("RGBA")
-        # Create a circle thumbnail file name
-        circle_thumbnail_file_name = '{0}-{1}.png'.format(
-            output_path, "circle")
-        # Create a new circle thumb mask
-        mask = Image.new('L', dimensions, 0)
-        # Instantiate Draw() for mask.
-        draw = ImageDraw.Draw(mask)
-        # Draw a circle with set size and fill.
-        draw.ellipse((0, 0) + dimensions, fill=255)
-        # Fit the image to the mask
-        circle_thumbnail = ImageOps.fit(
-            image_obj, mask.size, centering=(0.5, 0.5))
-        circle_thumbnail.putalpha(mask)
-        circle_thumbnail.save(circle_thumbnail_file_name, format="png")
-        circle_thumb = Image.open(circle_thumbnail_file_name)
+        full_path = self._image_path(src_directory, file_name)
+        # Get the circular thumb from the thumbnail cache, cropping it on first use.
+        circle_thumb = circle_thumbnail(full_path, dimensions, self.normalized_avatars_path)
+        # Optionally persist the thumbnail to disk
+        if self.save_thumbnails:
+            output_path = self.output_path + output_directory
+            if not os.path.exists(output_path):
+                os.makedirs(output_path)
+                print("{} created.".format(output_path))
+            # Create a circle thumbnail file name
+            circle_thumbnail_file_name = '{0}-{1}.png'.format(
+                output_path + file_name, "circle")
+            circle_thumb.save(circle_thumbnail_file_name, format="png")
         # Return the circular thumbnail
         return circle_thumb
 
 
+# Generator owned by a batch worker process
+_worker_generator = None
+
+
+def _init_render_worker(options, verbose):
+    """Builds the per-process generator used by create_images workers"""
+    global _worker_generator
+    _worker_generator = SocialImageGenerator(options)
+    _worker_generator._verbose = verbose
+
+
+def _render_in_worker(index, job, sink):
+    """
+    Renders one item of a batch inside a worker process, returning the result, any
+    bytes still to be written and the timings and counters recorded for it
+    """
+    result, data = _worker_generator._render_result(index, job, sink)
+    return result, data, _worker_generator.metrics.take()
+
+
 if __name__ == "__main__":
 
     # Instantiate the class with parameters of your choice
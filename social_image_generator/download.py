@@ -0,0 +1,120 @@
+from collections import namedtuple
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import os
+import requests
+import threading
+from .metrics import NullMetrics
+
+
+class DownloadResult(namedtuple("DownloadResult", ["url", "file_name", "path", "status", "error"])):
+    """
+    Outcome of downloading one url to a local path.
+    """
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Downloader:
+    """
+    Downloads files concurrently over a shared pool of keep-alive connections.
+    """
+
+    def __init__(self, max_workers=8, per_host=4, timeout=(5, 30), user_agent="Mozilla/5.0", store=None,
+                 metrics=None):
+        # Metrics counting downloads, bytes, revalidations and errors
+        if metrics is None:
+            metrics = NullMetrics()
+        self.metrics = metrics
+        # Optional AvatarStore used to cache and revalidate downloads across runs
+        self.store = store
+        # Number of downloads in flight across all hosts
+        self.max_workers = max_workers
+        # Number of downloads in flight against a single host
+        self.per_host = per_host
+        # (connect, read) timeout in seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        """Returns the semaphore limiting concurrent requests to the url's host"""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def fetch(self, url, path):
+        """Downloads url to path, writing through a temporary file"""
+        with self.metrics.timer("download"):
+            if self.store is not None:
+                result = self._fetch_from_store(url, path)
+            else:
+                result = self._fetch(url, path)
+        if not result.ok:
+            self.metrics.incr("download_errors")
+        elif result.status == 304:
+            self.metrics.incr("downloads_not_modified")
+        elif result.status == "cached":
+            self.metrics.incr("downloads_cached")
+        else:
+            self.metrics.incr("downloads")
+        return result
+
+    def _fetch(self, url, path):
+        """Downloads url straight to path"""
+        file_name = os.path.basename(path)
+        # Unique per thread so concurrent downloads to the same path do not collide
+        temp_path = "{0}.{1}-{2}.part".format(path, os.getpid(), threading.get_ident())
+        try:
+            with self._host_slot(url):
+                with self.session.get(url, timeout=self.timeout, stream=True) as resp:
+                    resp.raise_for_status()
+                    with open(temp_path, "wb") as f:
+                        for chunk in resp.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                            self.metrics.incr("download_bytes", len(chunk))
+                    os.replace(temp_path, path)
+                    return DownloadResult(url, file_name, path, resp.status_code, None)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return DownloadResult(url, file_name, path, None, e)
+
+    def _fetch_from_store(self, url, path):
+        """Fetches url through the avatar store and places the content at path"""
+        file_name = os.path.basename(path)
+        try:
+            with self._host_slot(url):
+                blob_path, status = self.store.fetch(self.session, url, timeout=self.timeout)
+            self.store.materialize(blob_path, path)
+            return DownloadResult(url, file_name, path, status, None)
+        except Exception as e:
+            return DownloadResult(url, file_name, path, None, e)
+
+    def fetch_many(self, items):
+        """
+        Downloads an iterable of (url, path) pairs concurrently.
+        Returns a DownloadResult per pair in input order. The avatar store, if any, is
+        saved and evicted once by close() rather than after every call.
+        """
+        items = list(items)
+        if not items:
+            return []
+        with futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(lambda item: self.fetch(*item), items))
+
+    def close(self):
+        """Saves the avatar store and closes the pooled connections"""
+        if self.store is not None:
+            self.store.save()
+        self.session.close()
@@ -0,0 +1,105 @@
+from PIL import Image
+from concurrent import futures
+import io
+import threading
+
+
+class Encoder:
+    """
+    Encodes images to bytes with configurable format and settings.
+
+    format is one of png, jpeg or webp. compress_level (0-9) and optimize apply to
+    PNG, colours quantizes PNG output to a palette of that many colours, and quality
+    applies to JPEG and WebP.
+    """
+
+    extensions = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+    content_types = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+    def __init__(self, format="png", compress_level=6, optimize=False, colours=None, quality=90):
+        if format not in self.extensions:
+            raise ValueError("Unsupported output format: {}".format(format))
+        self.format = format
+        self.compress_level = compress_level
+        self.optimize = optimize
+        self.colours = colours
+        self.quality = quality
+
+    @property
+    def extension(self):
+        """Returns the file extension for the output format"""
+        return self.extensions[self.format]
+
+    @property
+    def content_type(self):
+        """Returns the MIME type of the output format"""
+        return self.content_types[self.format]
+
+    def encode(self, image):
+        """Returns image encoded with this encoder's settings"""
+        output = io.BytesIO()
+        if self.format == "png":
+            if self.colours:
+                # Fast octree is the only quantizer Pillow supports for RGBA images
+                image = image.quantize(colors=self.colours, method=Image.FASTOCTREE)
+            image.save(output, format="png", compress_level=self.compress_level, optimize=self.optimize)
+        elif self.format == "jpeg":
+            image.convert("RGB").save(output, format="jpeg", quality=self.quality, optimize=self.optimize)
+        else:
+            image.save(output, format="webp", quality=self.quality)
+        return output.getvalue()
+
+
+class BackgroundWriter:
+    """
+    Runs encode and write jobs on a bounded pool of threads so the caller can rasterize
+    the next image while the previous one is encoded. submit() blocks once max_pending
+    jobs are queued so memory held by finished canvases stays bounded.
+    """
+
+    def __init__(self, max_workers=2, max_pending=None):
+        if max_pending is None:
+            max_pending = max_workers * 2
+        self.max_pending = max_pending
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queues fn(*args), waiting for a free slot, and returns its Future"""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def flush(self):
+        """Waits for every queued job and raises the first error any of them hit"""
+        with self._lock:
+            pending = list(self._pending)
+        futures.wait(pending)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Waits for every queued job and shuts the threads down"""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
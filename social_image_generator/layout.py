@@ -0,0 +1,162 @@
+from collections import namedtuple
+
+
+# A compiled layout bound to the per-image values it is rendered with
+RenderJob = namedtuple("RenderJob", ["layout", "file_name", "values"])
+
+
+def is_true(value):
+    """Returns True for the "True" strings used in options dictionaries and for True itself"""
+    return value is True or value == "True"
+
+
+class TextSlot:
+    """
+    A text element with its font, colour and position resolved. The text is either
+    fixed in value or taken from the bound values under the slot name.
+    """
+
+    def __init__(self, font_family, font_size, colour, x, y, box_width, centered,
+                 multiline, wrap_width, value=None, slot=None):
+        self.font_family = font_family
+        self.font_size = font_size
+        self.colour = colour
+        self.x = x
+        self.y = y
+        self.box_width = box_width
+        self.centered = centered
+        self.multiline = multiline
+        self.wrap_width = wrap_width
+        self.value = value
+        self.slot = slot
+
+    def resolve(self, values):
+        """Returns the text to draw given the bound values"""
+        if self.slot is not None:
+            return values[self.slot]
+        return self.value
+
+
+class ImageSlot:
+    """
+    A circular image element with its dimensions and position resolved. The image name
+    is either fixed or taken from the bound values under the slot name.
+    """
+
+    def __init__(self, dimensions, position, image_name=None, slot=None):
+        self.dimensions = dimensions
+        self.position = position
+        self.image_name = image_name
+        self.slot = slot
+
+    def resolve(self, values):
+        """Returns the image name to draw given the bound values"""
+        if self.slot is not None:
+            return values[self.slot]
+        return self.image_name
+
+
+class Layout:
+    """
+    A validated layout compiled from an options dictionary. Compile the static part of
+    the options once and bind the per-image values for each render.
+    """
+
+    def __init__(self, template, elements, options):
+        self.template = template
+        # TextSlot and ImageSlot objects in drawing order
+        self.elements = elements
+        # The options the layout was compiled from, used to fingerprint renders
+        self.options = options
+        self.slots = set(element.slot for element in elements if element.slot is not None)
+
+    def bind(self, file_name, **values):
+        """Returns a RenderJob rendering this layout with values to file_name"""
+        missing = self.slots - set(values)
+        if missing:
+            raise ValueError("Missing values for slots: {}".format(", ".join(sorted(missing))))
+        unknown = set(values) - self.slots
+        if unknown:
+            raise ValueError("Unknown slots: {}".format(", ".join(sorted(unknown))))
+        return RenderJob(self, file_name, values)
+
+
+def compile_text(options, assets_path, defaults):
+    """Compiles a text element options dictionary into a TextSlot"""
+    font_family = assets_path + defaults["text"]["font"]["family"]
+    font_size = int(defaults["text"]["font"]["size"])
+    colour = (255, 255, 255)
+    if "font" in options:
+        # Get the font family
+        if "family" in options["font"]:
+            font_family = assets_path + options["font"]["family"]
+        # Get the font size
+        if "size" in options["font"]:
+            font_size = int(options["font"]["size"])
+        # Get the Font Colour
+        if "colour" in options["font"]:
+            colour = (
+                int(options["font"]["colour"]["r"]),
+                int(options["font"]["colour"]["g"]),
+                int(options["font"]["colour"]["b"])
+            )
+    if "position" not in options:
+        raise ValueError("Text element has no position")
+    centered = "centered" in options and is_true(options["centered"])
+    if centered:
+        try:
+            x, x2 = options["position"]["x"]
+        except (TypeError, ValueError):
+            raise ValueError("Centered text needs a position x of [x, x2]")
+        x = int(x)
+        box_width = int(x2) - x
+    else:
+        x = int(options["position"]["x"])
+        box_width = 0
+    if "slot" in options:
+        value = None
+        slot = options["slot"]
+    else:
+        value = options.get("value", "Text not set")
+        slot = None
+    return TextSlot(
+        font_family, font_size, colour, x, int(options["position"]["y"]), box_width, centered,
+        "multiline" in options and is_true(options["multiline"]), options.get("wrap_width", 28),
+        value, slot)
+
+
+def compile_image(options):
+    """Compiles an image element options dictionary into an ImageSlot"""
+    for key in ("position", "dimensions"):
+        if key not in options:
+            raise ValueError("Image element has no {}".format(key))
+    if not ("circle" in options and is_true(options["circle"])):
+        raise ValueError("Only circle image elements are supported")
+    if "slot" not in options and "image_name" not in options:
+        raise ValueError("Image element has no image_name or slot")
+    return ImageSlot(
+        (int(options["dimensions"]["x"]), int(options["dimensions"]["y"])),
+        (int(options["position"]["x"]), int(options["position"]["y"])),
+        options.get("image_name"), options.get("slot"))
+
+
+def compile_layout(options, assets_path, defaults, template=None):
+    """
+    Compiles the elements of an options dictionary into a Layout, raising ValueError
+    if it is invalid. Elements may name a "slot" in place of their "value" or
+    "image_name" to have it bound per render.
+    """
+    if "template" in options:
+        template = options["template"]
+    if template is None:
+        raise ValueError("Layout has no template")
+    elements = []
+    for element in options.get("elements", {}):
+        for element_options in options["elements"][element]:
+            if element == "text":
+                elements.append(compile_text(element_options, assets_path, defaults))
+            elif element == "images":
+                elements.append(compile_image(element_options))
+            else:
+                raise ValueError("Unknown element type: {}".format(element))
+    return Layout(template, elements, options)
@@ -0,0 +1,68 @@
+from .thumbnails import file_digest
+import hashlib
+import json
+import os
+import threading
+
+
+def inputs_digest(values, files=()):
+    """
+    Returns a sha256 hex digest of a JSON serialisable value and the contents
+    of the given files. Missing files hash as missing rather than failing.
+    """
+    file_digests = {}
+    for file_name in files:
+        if os.path.exists(file_name):
+            file_digests[file_name] = file_digest(file_name)
+        else:
+            file_digests[file_name] = "missing"
+    inputs = json.dumps({"values": values, "files": file_digests},
+                        sort_keys=True, default=str)
+    return hashlib.sha256(inputs.encode("utf8")).hexdigest()
+
+
+class RenderManifest:
+    """
+    Records the digest of the inputs each output image was rendered from so that
+    unchanged images can be skipped on the next run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries, self.meta = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Loads the entries and metadata from disk, starting empty if the manifest is
+        missing or corrupt
+        """
+        try:
+            with open(self.path, "rt", encoding="utf8") as f:
+                manifest = json.load(f)
+            return manifest["entries"], manifest.get("meta", {})
+        except (OSError, ValueError, KeyError):
+            return {}, {}
+
+    def is_current(self, name, digest):
+        """Returns True if name was last rendered from inputs with digest"""
+        with self._lock:
+            return self._entries.get(name) == digest
+
+    def record(self, name, digest):
+        """Records that name has been rendered from inputs with digest"""
+        with self._lock:
+            self._entries[name] = digest
+
+    def entries(self):
+        """Returns a copy of the recorded name to digest mapping"""
+        with self._lock:
+            return dict(self._entries)
+
+    def save(self):
+        """Writes the manifest to disk"""
+        with self._lock:
+            temp_path = self.path + ".part"
+            with open(temp_path, "wt", encoding="utf8") as f:
+                json.dump({"entries": self._entries, "meta": self.meta}, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size in MiB of this process and, separately, of
+    its largest finished child process such as a batch worker, as (self, children).
+    Both are None where the platform cannot report them.
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    peaks = []
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        peaks.append(round(resource.getrusage(who).ru_maxrss * unit / (1024 * 1024), 1))
+    return tuple(peaks)
+
+
+class Metrics:
+    """
+    Collects per stage timings and counters while rendering.
+
+    Hooks are called as hook(kind, name, value) for every timing ("timing", stage,
+    seconds) and counter increment ("counter", name, amount), e.g. to forward them
+    to statsd or a progress display. Measurements merged from batch worker processes
+    are added to the summary without calling the hooks, and so are the hits, misses
+    and evictions of their caches; cache sizes and weights are this process's own.
+    """
+
+    enabled = True
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        # stage -> [count, total seconds, max seconds]
+        self._timings = {}
+        self._counters = {}
+        # Caches whose stats() are included in the summary
+        self._caches = {}
+        # Cache name -> (hits, misses, evictions) when the counters were last taken
+        self._cache_marks = {}
+        # Cache name -> hits, misses and evictions merged from other processes
+        self._merged_caches = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """Registers a hook called with (kind, name, value) for each measurement"""
+        self.hooks.append(hook)
+
+    def add_cache(self, name, cache):
+        """Includes the stats() of a cache in the summary"""
+        self._caches[name] = cache
+        # Only count what happens from now on, not hits inherited by a forked worker
+        stats = cache.stats()
+        with self._lock:
+            self._cache_marks[name] = (stats["hits"], stats["misses"], stats["evictions"])
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the body of a with block as stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        """Records one timing of stage"""
+        with self._lock:
+            timing = self._timings.setdefault(stage, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+        for hook in self.hooks:
+            hook("timing", stage, seconds)
+
+    def incr(self, name, amount=1):
+        """Adds amount to the counter name"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+        for hook in self.hooks:
+            hook("counter", name, amount)
+
+    def take(self):
+        """
+        Returns and resets the raw timings and counters, with the cache counters
+        since the last take, for merging into another Metrics
+        """
+        with self._lock:
+            cache_counts = {}
+            for name, cache in self._caches.items():
+                stats = cache.stats()
+                counts = (stats["hits"], stats["misses"], stats["evictions"])
+                marks = self._cache_marks.get(name, (0, 0, 0))
+                # A cleared cache restarts its counters from zero
+                if any(count < mark for count, mark in zip(counts, marks)):
+                    marks = (0, 0, 0)
+                cache_counts[name] = [count - mark for count, mark in zip(counts, marks)]
+                self._cache_marks[name] = counts
+            state = (self._timings, self._counters, cache_counts)
+            self._timings = {}
+            self._counters = {}
+        return state
+
+    def merge(self, state):
+        """Adds the raw timings, counters and cache counters taken from another Metrics"""
+        timings, counters, cache_counts = state
+        with self._lock:
+            for name, counts in cache_counts.items():
+                merged = self._merged_caches.setdefault(name, [0, 0, 0])
+                for index, count in enumerate(counts):
+                    merged[index] += count
+            for stage, (count, total, longest) in timings.items():
+                timing = self._timings.setdefault(stage, [0, 0.0, 0.0])
+                timing[0] += count
+                timing[1] += total
+                timing[2] = max(timing[2], longest)
+            for name, amount in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+
+    def summary(self):
+        """Returns the timings, counters, cache stats and peak RSS as a dictionary"""
+        with self._lock:
+            timings = {
+                stage: {
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "mean_ms": total / count * 1000,
+                    "max_ms": longest * 1000
+                }
+                for stage, (count, total, longest) in self._timings.items()
+            }
+            counters = dict(self._counters)
+            merged_caches = {name: list(counts) for name, counts in self._merged_caches.items()}
+        caches = {name: cache.stats() for name, cache in self._caches.items()}
+        for name, (hits, misses, evictions) in merged_caches.items():
+            stats = caches.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0})
+            stats["hits"] += hits
+            stats["misses"] += misses
+            stats["evictions"] += evictions
+        peak_self, peak_children = peak_rss_mb()
+        return {"timings": timings, "counters": counters, "caches": caches,
+                "peak_rss_mb": {"self": peak_self, "children": peak_children}}
+
+    def write_json(self, path):
+        """Writes the summary to path as JSON"""
+        with open(path, "wt", encoding="utf8") as f:
+            json.dump(self.summary(), f, indent=1, sort_keys=True)
+
+
+class _NullTimer:
+    """Reusable context manager that does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics that records nothing, used when instrumentation is disabled so the
+    instrumented code pays only for a method call.
+    """
+
+    enabled = False
+    _null_timer = _NullTimer()
+
+    def timer(self, stage):
+        return self._null_timer
+
+    def record(self, stage, seconds):
+        pass
+
+    def incr(self, name, amount=1):
+        pass
+
+    def take(self):
+        return None
+
+    def merge(self, state):
+        pass
@@ -0,0 +1,87 @@
+import queue
+import threading
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception raised in a stage on to the next stage or the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out, item, stop):
+    """Puts item on a bounded queue, giving up if the pipeline is stopped. Returns True if put."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(items, stop):
+    """Yields the items put on a queue until the end of the stage feeding it"""
+    while not stop.is_set():
+        try:
+            item = items.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _run_stage(stage, items, out, stop):
+    """Runs one stage on its thread, passing each output and then the end or any error on"""
+    try:
+        for item in stage(items):
+            if not _put(out, item, stop):
+                return
+    except BaseException as e:
+        _put(out, _Failure(e), stop)
+        return
+    _put(out, _DONE, stop)
+
+
+def run_pipeline(source, stages, maxsize=8):
+    """
+    Runs the items of source through a chain of stages and yields the output of the last.
+
+    Each stage is a callable taking an iterator of items and returning an iterator, e.g.
+    a generator function, and runs on its own thread. Stages are connected by queues
+    holding at most maxsize items, so a fast stage waits for a slow one instead of
+    buffering the whole input and every stage works on a different item at once.
+    Iterating source also runs on its own thread. An exception in any stage is raised
+    to the consumer, and closing the returned generator stops every stage.
+    """
+    stop = threading.Event()
+    threads = []
+    items = source
+    # The source is fed through like a stage that passes its items on unchanged
+    for stage in [iter] + list(stages):
+        out = queue.Queue(maxsize)
+        if threads:
+            items = _drain(items, stop)
+        thread = threading.Thread(target=_run_stage, args=(stage, items, out, stop), daemon=True)
+        thread.start()
+        threads.append(thread)
+        items = out
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
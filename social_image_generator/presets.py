@@ -0,0 +1,69 @@
+from PIL import Image
+from collections import namedtuple
+
+
+class Preset(namedtuple("Preset", ["name", "size", "safe_area", "format", "widths"])):
+    """
+    A named output format.
+
+    size is the (width, height) of the output. safe_area is the fraction of the composite
+    on the cropped axis that must remain visible when cropping it to the preset aspect
+    ratio; if more would be lost the composite is letterboxed instead. widths are extra
+    responsive widths rendered at the same aspect ratio.
+    """
+
+
+# Preset formats for the major social networks
+PRESETS = {
+    "facebook": Preset("facebook", (1200, 630), 0.9, "png", ()),
+    "twitter": Preset("twitter", (1200, 628), 0.9, "png", ()),
+    "linkedin": Preset("linkedin", (1200, 627), 0.9, "png", ()),
+    "pinterest": Preset("pinterest", (1000, 1500), 0.9, "png", ()),
+    "opengraph": Preset("opengraph", (1200, 630), 0.9, "png", (600, 300)),
+}
+
+
+def fit_preset(image, preset):
+    """
+    Returns image cropped or letterboxed to the aspect ratio of preset and
+    resized to its size.
+    """
+    width, height = image.size
+    target_width, target_height = preset.size
+    target_aspect = target_width / target_height
+    # Centered crop box with the preset aspect ratio
+    if width / height > target_aspect:
+        crop_width = round(height * target_aspect)
+        visible = crop_width / width
+        box = ((width - crop_width) // 2, 0, (width - crop_width) // 2 + crop_width, height)
+    else:
+        crop_height = round(width / target_aspect)
+        visible = crop_height / height
+        box = (0, (height - crop_height) // 2, width, (height - crop_height) // 2 + crop_height)
+    if visible >= preset.safe_area:
+        return image.resize(preset.size, Image.LANCZOS, box=box)
+    # Cropping would cut into the safe area, so letterbox on the template's corner colour
+    scale = min(target_width / width, target_height / height)
+    fitted = image.resize((round(width * scale), round(height * scale)), Image.LANCZOS)
+    canvas = Image.new(image.mode, preset.size, image.getpixel((0, 0)))
+    canvas.paste(fitted, ((target_width - fitted.width) // 2, (target_height - fitted.height) // 2))
+    return canvas
+
+
+def preset_images(image, presets):
+    """
+    Yields (name, image, format) for each preset and each of its responsive widths,
+    downscaling every output from the single composite image. The responsive widths
+    are resized before their preset image is yielded, so the caller may close each
+    image once it has been encoded.
+    """
+    for preset in presets:
+        preset_image = fit_preset(image, preset)
+        variants = []
+        for width in preset.widths:
+            height = round(width * preset.size[1] / preset.size[0])
+            variants.append(("{0}-{1}w".format(preset.name, width),
+                             preset_image.resize((width, height), Image.LANCZOS), preset.format))
+        yield preset.name, preset_image, preset.format
+        yield from variants
+
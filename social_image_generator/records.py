@@ -0,0 +1,116 @@
+import csv
+import itertools
+
+
+# Record field -> (header names it may appear under, column index in exports without a header)
+# for the Pathable meetings export
+SESSION_COLUMNS = {
+    "title": (("title", "name", "session title"), 4),
+    "blurb": (("description", "blurb", "abstract"), 5),
+    "session_id": (("session id", "id", "code", "session code"), 1),
+    "speakers": (("speakers", "speaker names", "presenters"), 10),
+    "tracks": (("tracks", "track"), 7),
+}
+
+# Record field -> (header names, column index without a header) for the Pathable attendees export
+USER_COLUMNS = {
+    "speaker_email": (("email", "email address"), 12),
+    "first_name": (("first name", "firstname"), 2),
+    "second_name": (("last name", "lastname", "second name", "surname"), 3),
+    "job_title": (("title", "job title", "position"), 4),
+    "company": (("company", "organization", "organisation"), 6),
+    "bio": (("bio", "biography", "about"), 7),
+    "photo_url": (("photo url", "photo", "avatar", "image url"), 16),
+}
+
+
+def _normalize_header(header):
+    """Returns a header lower cased with underscores and repeated spaces collapsed"""
+    return " ".join(header.replace("_", " ").lower().split())
+
+
+def _column_indexes(header, columns):
+    """
+    Returns the index of each field in a header row, None for fields it has no
+    column for, or None if the row matches none of the header names and so is not a
+    header.
+    """
+    positions = {}
+    for index, name in enumerate(header):
+        positions.setdefault(_normalize_header(name), index)
+    indexes = {}
+    matched = False
+    for field, (names, default) in columns.items():
+        indexes[field] = None
+        for name in names:
+            if name in positions:
+                indexes[field] = positions[name]
+                matched = True
+                break
+    if not matched:
+        return None
+    return indexes
+
+
+def read_records(path, columns, encoding="utf-8-sig"):
+    """
+    Yields a dictionary of the fields in columns for each row of a CSV file, reading
+    one row at a time so exports of any size are read in constant memory. Columns are
+    found by the names in the header row, or by their index in files without a
+    header. Missing columns and cells are read as empty strings.
+    """
+    with open(path, "rt", encoding=encoding, newline="") as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        indexes = _column_indexes(first, columns)
+        if indexes is None:
+            # No header, so the first row is data read by column index
+            indexes = {field: default for field, (names, default) in columns.items()}
+            reader = itertools.chain([first], reader)
+        for row in reader:
+            yield {field: row[index] if index is not None and index < len(row) else ""
+                   for field, index in indexes.items()}
+
+
+def read_sessions(path, encoding="utf-8-sig"):
+    """Yields a session record for each row of a Pathable meetings export"""
+    return read_records(path, SESSION_COLUMNS, encoding)
+
+
+def sched_session(record):
+    """
+    Returns a session record in the shape of a Sched.com API session, so CSV exports
+    can be fed through the same parsing as sessions from the store. The session id
+    is prefixed to the name, where the Sched session titles carry it.
+    """
+    name = record["title"]
+    if record["session_id"] and record["session_id"] not in name:
+        name = "{0} {1}".format(record["session_id"], name)
+    tracks = [track.strip() for track in record["tracks"].split(",") if track.strip()]
+    session = {
+        "name": name,
+        "description": record["blurb"],
+        "event_start": "",
+        "event_end": "",
+        "event_subtype": ",".join(tracks),
+        "goers": "0",
+        "venue": "",
+    }
+    if tracks:
+        session["event_type"] = tracks[0]
+    if record["speakers"]:
+        session["speakers"] = record["speakers"]
+    return session
+
+
+def read_sched_sessions(path, encoding="utf-8-sig"):
+    """Yields each session of a Pathable meetings export in the shape of a Sched.com session"""
+    for record in read_sessions(path, encoding):
+        yield sched_session(record)
+
+
+def read_users(path, encoding="utf-8-sig"):
+    """Yields a user record for each row of a Pathable attendees export"""
+    return read_records(path, USER_COLUMNS, encoding)
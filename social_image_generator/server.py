@@ -0,0 +1,148 @@
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlparse
+import traceback
+from .cache import LRUCache
+from .cache import SingleFlight
+from .layout import TextSlot
+
+
+class RenderService:
+    """
+    Renders images on demand from a compiled Layout.
+
+    The slot values of an image come from lookup(name), if given, overridden by any
+    request parameters naming one of the overridable slots: the text slots of the
+    layout unless given, as image slots name files on the server. Encoded images are
+    kept in an LRU bounded to max_bytes and keyed by the digest of everything they
+    render from, which doubles as their ETag, so a changed avatar or template is
+    rendered afresh. Concurrent requests for the same image share a single render.
+    """
+
+    def __init__(self, generator, layout, lookup=None, max_bytes=64 * 1024 * 1024, max_age=3600,
+                 overridable=None):
+        self.generator = generator
+        self.layout = layout
+        self.lookup = lookup
+        if overridable is None:
+            overridable = [element.slot for element in layout.elements
+                           if isinstance(element, TextSlot) and element.slot is not None]
+        self.overridable = frozenset(overridable)
+        # Seconds CDNs and browsers may use an image before revalidating it
+        self.max_age = max_age
+        self.cache = LRUCache(maxsize=4096, max_weight=max_bytes, weigher=len)
+        self._in_flight = SingleFlight()
+
+    def job(self, name, params=None):
+        """
+        Returns the RenderJob for an image name and request parameters. Raises KeyError
+        if lookup knows no such image and ValueError if slot values are missing.
+        """
+        values = {}
+        if self.lookup is not None:
+            found = self.lookup(name)
+            if found is None:
+                raise KeyError(name)
+            values.update(found)
+        if params:
+            for slot in self.overridable:
+                if slot in params:
+                    values[slot] = params[slot]
+        return self.layout.bind(name, **values)
+
+    def etag(self, job):
+        """Returns the quoted ETag of a RenderJob"""
+        return '"{}"'.format(self.generator.render_digest(job))
+
+    def render(self, job, etag=None):
+        """Returns the encoded image for a RenderJob, rendering it at most once per ETag"""
+        if etag is None:
+            etag = self.etag(job)
+        data = self.cache.get(etag)
+        if data is not None:
+            return data
+        return self._in_flight.do(etag, lambda: self._render(job, etag))
+
+    def _render(self, job, etag):
+        data = self.generator.render_bytes(job)
+        self.cache.put(etag, data)
+        return data
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves GET /<name><extension>?<slot>=<value> from the server's RenderService.
+    """
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        service = self.server.service
+        url = urlparse(self.path)
+        extension = service.generator.encoder.extension
+        name = unquote(url.path.lstrip("/"))
+        if not name.endswith(extension) or "/" in name:
+            return self.send_error(404)
+        name = name[:-len(extension)]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            job = service.job(name, params)
+            etag = service.etag(job)
+        except KeyError:
+            return self.send_error(404)
+        except ValueError as e:
+            return self.send_error(400, str(e))
+        except Exception:
+            traceback.print_exc()
+            return self.send_error(500)
+        try:
+            # The client already has this rendering
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self._send_cache_headers(service, etag)
+                self.end_headers()
+                return
+            data = service.render(job, etag)
+        except Exception:
+            traceback.print_exc()
+            return self.send_error(500)
+        self.send_response(200)
+        self.send_header("Content-Type", service.generator.encoder.content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self._send_cache_headers(service, etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def _send_cache_headers(self, service, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age={}".format(service.max_age))
+
+    def log_message(self, format, *args):
+        if self.server.service.generator._verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def make_server(service, host="127.0.0.1", port=8000):
+    """Returns a threaded HTTP server for a RenderService, call serve_forever() to run it"""
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(generator, layout, host="127.0.0.1", port=8000, lookup=None, max_bytes=64 * 1024 * 1024,
+          overridable=None):
+    """Serves images rendered from layout by generator until interrupted"""
+    service = RenderService(generator, layout, lookup, max_bytes, overridable=overridable)
+    server = make_server(service, host, port)
+    print("Serving images on http://{0}:{1}/".format(host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,81 @@
+from .manifest import RenderManifest
+import hashlib
+import os
+
+
+def parse_shard(shard):
+    """Returns (index, count) for a shard written as "i/N" where 1 <= i <= N"""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError("Shard must be written as i/N, got {!r}".format(shard))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("Shard index must be between 1 and {0}, got {1!r}".format(count, shard))
+    return index, count
+
+
+def shard_index(key, count):
+    """
+    Returns the shard, from 1 to count, that key belongs to. Uses a stable hash so
+    every machine and run assigns a key to the same shard.
+    """
+    digest = hashlib.sha256(str(key).encode("utf8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(key, shard):
+    """Returns True if key belongs to shard, an (index, count) pair, or shard is None"""
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_index(key, count) == index
+
+
+def shard_manifest_path(manifest_path, shard):
+    """Returns the path of the manifest written by one shard of a run"""
+    index, count = shard
+    base = manifest_path
+    if base.endswith(".manifest.json"):
+        base = base[:-len(".manifest.json")]
+    return "{0}.shard-{1}-of-{2}.manifest.json".format(base, index, count)
+
+
+def record_assigned(manifest, shard, names):
+    """Records the shard and the names it was assigned in a shard manifest"""
+    index, count = shard
+    manifest.meta["shard"] = {"index": index, "count": count}
+    manifest.meta["assigned"] = sorted(names)
+
+
+def merge_shard_manifests(manifest_path, count, expected=None):
+    """
+    Combines the manifests written by each of count shards into the manifest at
+    manifest_path and verifies that together they cover the whole run: every shard
+    wrote a manifest, every name a shard was assigned was rendered, each name was
+    assigned to exactly one shard, and, if given, every name in expected is covered.
+    Returns a list of problems found, empty when coverage is complete.
+    """
+    problems = []
+    merged = RenderManifest(manifest_path)
+    owners = {}
+    for index in range(1, count + 1):
+        path = shard_manifest_path(manifest_path, (index, count))
+        if not os.path.exists(path):
+            problems.append("Shard {0}/{1} wrote no manifest at {2}".format(index, count, path))
+            continue
+        shard_manifest = RenderManifest(path)
+        entries = shard_manifest.entries()
+        assigned = shard_manifest.meta.get("assigned", sorted(entries))
+        for name in assigned:
+            if name in owners:
+                problems.append("{0} was assigned to shards {1} and {2}".format(name, owners[name], index))
+            owners[name] = index
+            if name in entries:
+                merged.record(name, entries[name])
+            else:
+                problems.append("{0} was not rendered by shard {1}/{2}".format(name, index, count))
+    if expected is not None:
+        for name in sorted(set(expected) - set(owners)):
+            problems.append("{0} was not assigned to any shard".format(name))
+    merged.save()
+    return problems
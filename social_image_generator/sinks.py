@@ -0,0 +1,133 @@
+import io
+import os
+import tarfile
+import threading
+import time
+import zipfile
+
+
+class Sink:
+    """
+    Base class of the destinations rendered images are written to.
+    """
+
+    # Whether worker processes may write to the sink themselves
+    shareable = False
+
+    def write(self, name, data):
+        """Writes the encoded image data under name and returns where it went"""
+        raise NotImplementedError
+
+    def exists(self, name):
+        """Returns True if an image written in an earlier run is still present"""
+        return False
+
+    def location(self, name):
+        """Returns where an image written under name ends up"""
+        return name
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DirectorySink(Sink):
+    """
+    Writes each image to a file in a directory.
+    """
+
+    # Worker processes may write to the directory themselves
+    shareable = True
+
+    def __init__(self, path):
+        if not path.endswith("/"):
+            path += "/"
+        self.path = path
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def write(self, name, data):
+        """Writes data to name in the directory and returns its path"""
+        output_file = self.location(name)
+        temp_path = "{0}.{1}.part".format(output_file, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, output_file)
+        return output_file
+
+    def exists(self, name):
+        """Returns True if name has already been written to the directory"""
+        return os.path.exists(self.location(name))
+
+    def location(self, name):
+        """Returns the path of name in the directory"""
+        return self.path + name
+
+
+class MemorySink(Sink):
+    """
+    Keeps each encoded image in memory.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        """Stores data under name and returns the name"""
+        with self._lock:
+            self.images[name] = data
+        return name
+
+    def get(self, name):
+        """Returns the encoded image stored under name as a BytesIO"""
+        return io.BytesIO(self.images[name])
+
+
+class TarSink(Sink):
+    """
+    Streams each image into a single tar archive as it is produced.
+    """
+
+    def __init__(self, path, mode="w"):
+        # mode may be "w:gz" etc. to compress the archive
+        self.path = path
+        self._archive = tarfile.open(path, mode)
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        """Appends data to the archive as name and returns the name"""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        with self._lock:
+            self._archive.addfile(info, io.BytesIO(data))
+        return name
+
+    def close(self):
+        """Finishes and closes the archive"""
+        with self._lock:
+            self._archive.close()
+
+
+class ZipSink(TarSink):
+    """
+    Streams each image into a single zip archive as it is produced. Images are stored
+    uncompressed as PNG data is already compressed.
+    """
+
+    def __init__(self, path, compression=zipfile.ZIP_STORED):
+        self.path = path
+        self._archive = zipfile.ZipFile(path, "w", compression=compression)
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        """Adds data to the archive as name and returns the name"""
+        with self._lock:
+            self._archive.writestr(name, data)
+        return name
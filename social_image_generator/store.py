@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SchedStore:
+    """
+    Local SQLite copy of the sessions and users of a Sched.com event.
+
+    Sessions are keyed by their Sched id and users by their username, each kept as
+    the JSON object the API returned. The time of the last sync of each resource is
+    recorded so the next run only asks for what changed since, and a run can work
+    entirely from the store when the API is not needed.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        # The connection is shared by the pipeline threads, one statement at a time
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    name TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    name TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS users_name ON users (name);
+                CREATE TABLE IF NOT EXISTS syncs (
+                    resource TEXT PRIMARY KEY,
+                    synced_at INTEGER NOT NULL
+                );
+            """)
+
+    def last_sync(self, resource):
+        """Returns the unix time resource was last synced or None if it never was"""
+        with self._lock:
+            row = self._db.execute("SELECT synced_at FROM syncs WHERE resource = ?", (resource,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def mark_synced(self, resource, synced_at=None):
+        """Records that resource was synced at synced_at, now by default"""
+        if synced_at is None:
+            synced_at = int(time.time())
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO syncs (resource, synced_at) VALUES (?, ?)",
+                             (resource, synced_at))
+
+    def update_sessions(self, sessions):
+        """
+        Inserts or replaces sessions returned by the API. Sessions marked inactive have
+        been deleted on Sched and are removed. Returns the number of sessions changed.
+        """
+        changed = 0
+        with self._lock, self._db:
+            for session in sessions:
+                session_id = str(session.get("id") or session.get("event_key") or session["name"])
+                if session.get("active") == "N":
+                    self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                else:
+                    self._db.execute("INSERT OR REPLACE INTO sessions (session_id, name, data) VALUES (?, ?, ?)",
+                                     (session_id, session.get("name"), json.dumps(session)))
+                changed += 1
+        return changed
+
+    def update_users(self, users):
+        """Inserts or replaces users returned by the API. Returns the number of users changed."""
+        changed = 0
+        with self._lock, self._db:
+            for user in users:
+                self._db.execute("INSERT OR REPLACE INTO users (username, name, data) VALUES (?, ?, ?)",
+                                 (user["username"], user.get("name"), json.dumps(user)))
+                changed += 1
+        return changed
+
+    def _rows(self, query, args=(), batch_size=256):
+        """Yields the decoded data of each row of a query, reading batch_size rows at a time"""
+        offset = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    query + " LIMIT ? OFFSET ?", tuple(args) + (batch_size, offset)).fetchall()
+            for row in rows:
+                yield json.loads(row[0])
+            if len(rows) < batch_size:
+                return
+            offset += batch_size
+
+    def sessions(self):
+        """Yields every stored session"""
+        return self._rows("SELECT data FROM sessions ORDER BY session_id")
+
+    def users(self):
+        """Yields every stored user"""
+        return self._rows("SELECT data FROM users ORDER BY username")
+
+    def user(self, username):
+        """Returns the stored user with username or None"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def missing_user_names(self, names):
+        """Returns the set of names that no stored user has"""
+        missing = set()
+        with self._lock:
+            for name in set(names):
+                if self._db.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone() is None:
+                    missing.add(name)
+        return missing
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,94 @@
+from PIL import Image
+from PIL import ImageDraw
+from .cache import LRUCache
+from .cache import get_font
+import math
+import os
+import textwrap
+
+
+# Line breaks and offsets keyed by (text, font, size, wrap width, alignment)
+layout_cache = LRUCache(maxsize=8192)
+# Rasterized (mask, offset) text runs keyed by (text, font, size, subpixel origin)
+text_run_cache = LRUCache(maxsize=8192, max_weight=32 * 1024 * 1024,
+                          weigher=lambda run: run[0].width * run[0].height)
+
+
+def layout_text(text, font_family, font_size, wrap_width=28, centered=False, multiline=False, box_width=0):
+    """
+    Returns a tuple of (x_offset, y_offset, line) for each line of text, relative to
+    the text origin. Centered text is positioned within box_width, the distance between
+    the two x coordinates of a centered element. Layouts are cached so repeated strings
+    are only wrapped and measured once per process.
+    """
+    key = (text, os.path.realpath(font_family), int(font_size), wrap_width, centered, multiline, box_width)
+
+    def measure():
+        image_font = get_font(font_family, font_size)
+        # Check to see if the text we are writing out should be on multiple lines.
+        if not multiline:
+            if centered:
+                # Get the width of the text and calculate the start of the line.
+                text_width, text_height = image_font.getsize(str(text))
+                return ((box_width - text_width / 2, 0, text),)
+            return ((0, 0, text),)
+        # Convert the text into multiple lines
+        lines = []
+        line_y = 0
+        for line in textwrap.wrap(text, width=wrap_width):
+            # Get the width and height of each line.
+            width, height = image_font.getsize(line)
+            if centered:
+                # Calculate the start of each line based on the width of that particular line
+                lines.append((box_width - width / 2, line_y, line))
+            else:
+                lines.append((0, line_y, line))
+            line_y += height
+        return tuple(lines)
+
+    return layout_cache.get_or_create(key, measure)
+
+
+def text_run(text, font_family, font_size, origin=(0, 0)):
+    """
+    Returns (mask, offset) for a single line of text: an L mode image of its glyph coverage
+    and the position of the mask relative to the integer part of origin. Glyphs are
+    rasterized at the fractional part of origin so the mask matches ImageDraw.text
+    exactly. Runs are cached so repeated labels are only rasterized once per process.
+    The returned mask is shared and must not be modified.
+    """
+    fraction = (origin[0] - math.floor(origin[0]), origin[1] - math.floor(origin[1]))
+    key = (text, os.path.realpath(font_family), int(font_size), fraction)
+
+    def rasterize():
+        image_font = get_font(font_family, font_size)
+        # Measure the glyphs with getmask2, which every supported Pillow has
+        glyphs, (left, top) = image_font.getmask2(text, "L")
+        width, height = glyphs.size
+        # Pad the mask so glyphs reaching left of or above the origin, or shifted by
+        # the fractional origin, are not clipped
+        pad_x = max(0, -left) + 2
+        pad_y = max(0, -top) + 2
+        mask = Image.new("L", (pad_x + left + width + 2, pad_y + top + height + 2), 0)
+        ImageDraw.Draw(mask).text((pad_x + fraction[0], pad_y + fraction[1]), text, 255, font=image_font)
+        # Keep only the covered pixels
+        bbox = mask.getbbox()
+        if bbox is None:
+            return Image.new("L", (0, 0)), (0, 0)
+        return mask.crop(bbox), (bbox[0] - pad_x, bbox[1] - pad_y)
+
+    return text_run_cache.get_or_create(key, rasterize)
+
+
+def draw_text_run(draw, xy, text, font_family, font_size, colour):
+    """
+    Draws a line of text at xy on an ImageDraw object by filling colour through its
+    cached text_run mask, the same result as draw.text in a single paste. Text with
+    line breaks is left to draw.text, which lays the lines out itself.
+    """
+    if "\n" in text:
+        draw.text(xy, text, colour, font=get_font(font_family, font_size))
+        return
+    mask, (offset_x, offset_y) = text_run(text, font_family, font_size, xy)
+    if mask.width and mask.height:
+        draw.bitmap((math.floor(xy[0]) + offset_x, math.floor(xy[1]) + offset_y), mask, fill=colour)
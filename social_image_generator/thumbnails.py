@@ -0,0 +1,122 @@
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageOps
+from .cache import LRUCache
+from .cache import image_bytes
+import hashlib
+import math
+import os
+import threading
+
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Ellipse masks keyed by dimensions
+mask_cache = LRUCache(maxsize=16)
+# Source file digests keyed by (path, mtime, size)
+digest_cache = LRUCache(maxsize=4096)
+# Finished circular thumbnails keyed by (source digest, dimensions)
+thumbnail_cache = LRUCache(maxsize=1024, max_weight=256 * 1024 * 1024, weigher=image_bytes)
+
+
+def file_digest(file_name):
+    """Returns the sha1 hex digest of a file, re-hashing only when it changes on disk"""
+    full_path = os.path.realpath(file_name)
+    stat = os.stat(full_path)
+    key = (full_path, stat.st_mtime_ns, stat.st_size)
+
+    def hash_file():
+        digest = hashlib.sha1()
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    return digest_cache.get_or_create(key, hash_file)
+
+
+def circle_mask(dimensions):
+    """Returns a cached L mode mask with a filled ellipse of the given dimensions"""
+    dimensions = tuple(int(d) for d in dimensions)
+
+    def draw_mask():
+        # Create a new circle thumb mask
+        mask = Image.new('L', dimensions, 0)
+        # Instantiate Draw() for mask.
+        draw = ImageDraw.Draw(mask)
+        # Draw a circle with set size and fill.
+        draw.ellipse((0, 0) + dimensions, fill=255)
+        return mask
+
+    return mask_cache.get_or_create(dimensions, draw_mask)
+
+
+def load_fitted(file_name, dimensions):
+    """
+    Decodes an image file upright, per its EXIF orientation, as an RGBA image cropped
+    to the aspect ratio of dimensions and resized to them. JPEGs are decoded at the
+    smallest DCT scale (1/2, 1/4 or 1/8) that still covers dimensions, so a large
+    photo costs a fraction of the decode time and memory of a full decode.
+    """
+    width, height = dimensions
+    with Image.open(file_name) as image_obj:
+        if image_obj.format == "JPEG":
+            # Orientation is applied after decoding, so measure against the stored axes
+            if image_obj.getexif().get(0x0112) in ROTATED_ORIENTATIONS:
+                width, height = height, width
+            scale = min(image_obj.width / width, image_obj.height / height)
+            if scale >= 2:
+                image_obj.draft(None, (math.ceil(image_obj.width / scale), math.ceil(image_obj.height / scale)))
+        image = ImageOps.exif_transpose(image_obj).convert("RGBA")
+    return ImageOps.fit(image, dimensions, centering=(0.5, 0.5))
+
+
+# Serializes writing normalized avatars so each is written once
+_normalize_lock = threading.Lock()
+
+
+def normalized_avatar(file_name, dimensions, directory):
+    """
+    Returns the path of an upright copy of an image file already fitted to dimensions,
+    writing it to directory on first use. Copies are named by the source digest so a
+    photo is only decoded at full size once however many runs and workers use it.
+    """
+    dimensions = tuple(int(d) for d in dimensions)
+    if not directory.endswith("/"):
+        directory += "/"
+    path = "{0}{1}-{2}x{3}.png".format(directory, file_digest(file_name), *dimensions)
+    if os.path.exists(path):
+        return path
+    with _normalize_lock:
+        if not os.path.exists(path):
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            temp_path = "{0}.{1}.part".format(path, os.getpid())
+            load_fitted(file_name, dimensions).save(temp_path, format="png")
+            os.replace(temp_path, path)
+    return path
+
+
+def circle_thumbnail(file_name, dimensions, normalized_directory=None):
+    """
+    Returns a circular RGBA thumbnail of an image file. Thumbnails are cached by the
+    source file digest and dimensions so each image is only cropped once per process.
+    With a normalized_directory the fitted image is also kept on disk and reused by
+    later runs. The returned image is shared and must not be modified.
+    """
+    dimensions = tuple(int(d) for d in dimensions)
+    key = (file_digest(file_name), dimensions)
+
+    def crop_thumbnail():
+        mask = circle_mask(dimensions)
+        # Fit the image to the mask
+        if normalized_directory:
+            with Image.open(normalized_avatar(file_name, dimensions, normalized_directory)) as image_obj:
+                thumbnail = image_obj.convert("RGBA")
+        else:
+            thumbnail = load_fitted(file_name, mask.size)
+        thumbnail.putalpha(mask)
+        return thumbnail
+
+    return thumbnail_cache.get_or_create(key, crop_thumbnail)
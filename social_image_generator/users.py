@@ -0,0 +1,127 @@
+import re
+import unicodedata
+
+
+def normalize_name(name):
+    """
+    Returns a name reduced for matching: accents removed, case folded, punctuation
+    dropped and whitespace collapsed, so "José  O'Neil" matches "jose oneil".
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = re.sub(r"[^\w\s]", "", name.casefold())
+    return " ".join(name.split())
+
+
+class UserDirectory:
+    """
+    Users indexed by name, normalized name, username and email for O(1) lookups.
+
+    A user added again, matched by username, then email, then name, is merged into
+    the existing record: empty fields are filled in, and the fields in replace_fields
+    take the latest non-empty value while every other field keeps its first one.
+    When different users share a name, lookups by name return the one with the most
+    prefer_fields filled in and then the lowest username, so the result does not
+    depend on the order they were added in.
+    """
+
+    def __init__(self, users=(), replace_fields=("avatar", "company", "position"), prefer_fields=("avatar",)):
+        self.replace_fields = set(replace_fields)
+        self.prefer_fields = tuple(prefer_fields)
+        self._users = []
+        self._by_username = {}
+        self._by_email = {}
+        self._by_name = {}
+        self._by_normalized_name = {}
+        for user in users:
+            self.add(user)
+
+    def _find(self, user):
+        """Returns the stored record the user should be merged into or None"""
+        if user.get("username") and user["username"] in self._by_username:
+            return self._by_username[user["username"]]
+        if user.get("email") and user["email"].lower() in self._by_email:
+            return self._by_email[user["email"].lower()]
+        if not user.get("username") and user.get("name") in self._by_name:
+            return self._by_name[user["name"]]
+        return None
+
+    def _rank(self, record):
+        """Returns the sort key choosing between users that share a name, lowest first"""
+        filled = sum(1 for field in self.prefer_fields if record.get(field))
+        return -filled, record.get("username") or ""
+
+    def _index_name(self, index, key, record):
+        """Points key at record unless it already points at a better ranked user"""
+        existing = index.get(key)
+        if existing is None or existing is record or self._rank(record) < self._rank(existing):
+            index[key] = record
+
+    def _index(self, record):
+        if record.get("username"):
+            self._by_username[record["username"]] = record
+        if record.get("email"):
+            self._by_email.setdefault(record["email"].lower(), record)
+        if record.get("name"):
+            self._index_name(self._by_name, record["name"], record)
+            self._index_name(self._by_normalized_name, normalize_name(record["name"]), record)
+
+    def add(self, user):
+        """Adds a user dictionary or merges it into the matching record. Returns the record."""
+        record = self._find(user)
+        if record is None:
+            record = dict(user)
+            self._users.append(record)
+        else:
+            for field, value in user.items():
+                if value in (None, ""):
+                    continue
+                if record.get(field) in (None, "") or field in self.replace_fields:
+                    record[field] = value
+        self._index(record)
+        return record
+
+    def get(self, key, default=None):
+        """Returns the user with a username, email, name or normalized name of key"""
+        if key in self._by_username:
+            return self._by_username[key]
+        if key.lower() in self._by_email:
+            return self._by_email[key.lower()]
+        if key in self._by_name:
+            return self._by_name[key]
+        return self._by_normalized_name.get(normalize_name(key), default)
+
+    def resolve(self, names):
+        """
+        Returns (users, missing) for a comma separated string or list of speaker names,
+        usernames or emails, where missing lists the keys no user matched
+        """
+        if isinstance(names, str):
+            names = names.split(",")
+        users = []
+        missing = []
+        for name in names:
+            name = name.strip()
+            if not name:
+                continue
+            user = self.get(name)
+            if user is None:
+                missing.append(name)
+            else:
+                users.append(user)
+        return users, missing
+
+    def __getitem__(self, key):
+        user = self.get(key)
+        if user is None:
+            raise KeyError(key)
+        return user
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def __len__(self):
+        return len(self._users)
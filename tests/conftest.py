@@ -0,0 +1,29 @@
+import os
+import pytest
+from PIL import Image
+from social_image_generator import SocialImageGenerator
+
+
+ASSETS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+
+def white_text(slot, x, y, size=28):
+    """Returns a text element options dictionary for a slot in white Lato Bold"""
+    return {"slot": slot, "position": {"x": x, "y": y},
+            "font": {"size": size, "family": "fonts/Lato-Bold.ttf", "colour": {"r": 255, "g": 255, "b": 255}}}
+
+
+@pytest.fixture
+def make_generator(tmp_path):
+    """Returns a function building a quiet generator writing under tmp_path"""
+    template = str(tmp_path / "template.png")
+    Image.new("RGB", (1200, 675), (20, 40, 90)).save(template)
+
+    def make(**settings):
+        options = {"output": str(tmp_path / "output"), "assets_path": ASSETS_PATH, "template": template}
+        options.update(settings)
+        generator = SocialImageGenerator(options)
+        generator._verbose = False
+        return generator
+
+    return make
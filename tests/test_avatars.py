@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from social_image_generator import avatars
+from social_image_generator import AvatarStore
+from social_image_generator import Downloader
+
+
+class AvatarHandler(BaseHTTPRequestHandler):
+    """Serves the bodies of the server with an ETag, answering matching revalidations with 304"""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        body = self.server.bodies.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:16])
+        if self.headers.get("If-None-Match") == etag:
+            # Sent without validators, so the store must keep the ones it had
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Clock:
+    """Stands in for the time module so tests can age the store"""
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AvatarHandler)
+    server.bodies = {"/a.jpg": os.urandom(4096), "/b.jpg": os.urandom(4096)}
+    server.bodies["/copy-of-a.jpg"] = server.bodies["/a.jpg"]
+    server.requests = []
+    server.url = "http://127.0.0.1:{}".format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(avatars, "time", clock)
+    return clock
+
+
+def blobs(tmp_path):
+    return sorted(os.listdir(str(tmp_path / "store" / "blobs")))
+
+
+def test_later_runs_revalidate_with_the_stored_etag(tmp_path, server):
+    url = server.url + "/a.jpg"
+    with requests.Session() as session:
+        store = AvatarStore(str(tmp_path / "store"))
+        blob_path, status = store.fetch(session, url)
+        assert status == 200
+        with open(blob_path, "rb") as f:
+            assert f.read() == server.bodies["/a.jpg"]
+        store.save()
+        assert server.requests == [("/a.jpg", None)]
+
+        # Each run revalidates once, and a 304 keeps the validators it was sent with
+        for run in range(2):
+            store = AvatarStore(str(tmp_path / "store"))
+            assert store.fetch(session, url) == (blob_path, 304)
+            store.save()
+    sent = [validator for path, validator in server.requests[1:]]
+    assert len(sent) == 2 and sent[0] is not None and sent[0] == sent[1]
+
+
+def test_urls_are_fetched_once_per_run(tmp_path, server):
+    store = AvatarStore(str(tmp_path / "store"))
+    url = server.url + "/a.jpg"
+    with requests.Session() as session:
+        threads = [threading.Thread(target=store.fetch, args=(session, url)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert store.fetch(session, url)[1] == "cached"
+        # Urls serving the same content share one blob
+        store.fetch(session, server.url + "/copy-of-a.jpg")
+    assert [path for path, validator in server.requests] == ["/a.jpg", "/copy-of-a.jpg"]
+    assert len(blobs(tmp_path)) == 1
+
+
+def test_eviction_by_age(tmp_path, server, clock):
+    store = AvatarStore(str(tmp_path / "store"), max_age=60)
+    with requests.Session() as session:
+        store.fetch(session, server.url + "/a.jpg")
+        clock.now += 120
+        store.fetch(session, server.url + "/b.jpg")
+    store.save()
+    digest = hashlib.sha256(server.bodies["/b.jpg"]).hexdigest()
+    assert blobs(tmp_path) == [digest]
+    assert list(AvatarStore(str(tmp_path / "store"))._index) == [server.url + "/b.jpg"]
+
+
+def test_eviction_by_size_drops_the_least_recently_used(tmp_path, server, clock):
+    store = AvatarStore(str(tmp_path / "store"), max_bytes=6000)
+    with requests.Session() as session:
+        store.fetch(session, server.url + "/a.jpg")
+        clock.now += 1
+        store.fetch(session, server.url + "/b.jpg")
+        clock.now += 1
+        # Using a again makes b the least recently used
+        store.fetch(session, server.url + "/a.jpg")
+    store.save()
+    assert blobs(tmp_path) == [hashlib.sha256(server.bodies["/a.jpg"]).hexdigest()]
+
+
+def test_materialize_hard_links_the_blob(tmp_path, server):
+    store = AvatarStore(str(tmp_path / "store"))
+    with requests.Session() as session:
+        blob_path, status = store.fetch(session, server.url + "/a.jpg")
+    path = str(tmp_path / "a.jpg")
+    with open(path, "wb") as f:
+        f.write(b"stale")
+    assert store.materialize(blob_path, path) is True
+    assert os.path.samefile(blob_path, path)
+    assert os.stat(blob_path).st_nlink == 2
+    assert store.materialize(blob_path, path) is False
+    assert sorted(os.listdir(str(tmp_path))) == ["a.jpg", "store"]
+
+
+def test_downloader_saves_the_store_on_close(tmp_path, server):
+    store = AvatarStore(str(tmp_path / "store"))
+    downloader = Downloader(store=store)
+    for name in ("a.jpg", "b.jpg"):
+        results = downloader.fetch_many([(server.url + "/" + name, str(tmp_path / name))])
+        assert results[0].ok
+    assert not (tmp_path / "store" / "index.json").exists()
+    downloader.close()
+    assert len(AvatarStore(str(tmp_path / "store"))._index) == 2
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from PIL import Image
+from social_image_generator import LRUCache
+from social_image_generator import SingleFlight
+from social_image_generator import TemplateCache
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache and "b" not in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_are_evicted_by_weight():
+    cache = LRUCache(maxsize=100, max_weight=10, weigher=len)
+    cache.put("a", b"xxxx")
+    cache.put("b", b"xxxx")
+    cache.put("c", b"xxxx")
+    assert "a" not in cache and len(cache) == 2 and cache.weight == 8
+    # Replacing an entry reweighs it
+    cache.put("b", b"x")
+    assert cache.weight == 5
+    cache.pop("c")
+    assert cache.weight == 1
+
+
+def test_an_entry_heavier_than_the_limit_is_still_kept():
+    cache = LRUCache(maxsize=10, max_weight=4, weigher=len)
+    cache.put("a", b"xx")
+    cache.put("big", b"xxxxxxxx")
+    assert "a" not in cache and "big" in cache and len(cache) == 1
+
+
+def test_get_or_create_counts_hits_and_misses():
+    cache = LRUCache()
+    calls = []
+    for number in range(3):
+        assert cache.get_or_create("key", lambda: calls.append(1) or "value") == "value"
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_template_cache_reloads_changed_templates(tmp_path):
+    path = str(tmp_path / "template.png")
+    Image.new("RGB", (4, 4), (255, 0, 0)).save(path)
+    cache = TemplateCache()
+    first = cache.get_template(path)
+    first.putpixel((0, 0), (0, 0, 0, 255))
+    assert cache.get_template(path).getpixel((0, 0)) == (255, 0, 0, 255)
+    Image.new("RGB", (4, 4), (0, 255, 0)).save(path)
+    os.utime(path, ns=(time.time_ns() + 10 ** 9,) * 2)
+    assert cache.get_template(path).getpixel((0, 0)) == (0, 255, 0, 255)
+    assert len(cache) == 1
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "done"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for number in range(5)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["done"] * 5
+    assert len(calls) == 1
@@ -0,0 +1,54 @@
+import io
+import json
+import sys
+from social_image_generator.cli import main
+from .conftest import ASSETS_PATH
+
+
+def talk(number):
+    return {"file_name": "S{}".format(number),
+            "elements": {"text": [{"value": "Talk {}".format(number), "position": {"x": 80, "y": 340},
+                                   "font": {"size": 28, "family": "fonts/Lato-Bold.ttf",
+                                            "colour": {"r": 255, "g": 255, "b": 255}}}]}}
+
+
+def run(tmp_path, options, *flags):
+    output = tmp_path / "output"
+    status = main([options, "--output", str(output), "--assets", ASSETS_PATH,
+                   "--template", str(tmp_path / "template.png"), "--quiet"] + list(flags))
+    return status, sorted(path.name for path in output.glob("*.png")) if output.exists() else []
+
+
+def test_renders_json_and_json_lines_files(make_generator, tmp_path):
+    (tmp_path / "talks.json").write_text(json.dumps([talk(0), talk(1)], indent=2))
+    assert run(tmp_path, str(tmp_path / "talks.json")) == (0, ["S0.png", "S1.png"])
+    (tmp_path / "talks.jsonl").write_text("\n".join(json.dumps(talk(number)) for number in (2, 3)) + "\n\n")
+    assert run(tmp_path, str(tmp_path / "talks.jsonl")) == (0, ["S0.png", "S1.png", "S2.png", "S3.png"])
+
+
+def test_reads_json_lines_and_json_from_stdin(make_generator, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(json.dumps(talk(number)) for number in range(3))))
+    assert run(tmp_path, "-") == (0, ["S0.png", "S1.png", "S2.png"])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(talk(3), indent=2)))
+    assert run(tmp_path, "-") == (0, ["S0.png", "S1.png", "S2.png", "S3.png"])
+
+
+def test_malformed_options_exit_with_a_one_line_error(make_generator, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(talk(0)) + "\n{not json\n"))
+    assert run(tmp_path, "-") == (2, ["S0.png"])
+    error = capsys.readouterr().err
+    assert error.startswith("Cannot read the options: <stdin> line 2:") and error.count("\n") == 1
+
+    (tmp_path / "talks.json").write_text('[\n  {"file_name": "S1"},\n  oops\n]')
+    assert run(tmp_path, str(tmp_path / "talks.json"))[0] == 2
+    assert "line 3" in capsys.readouterr().err
+    (tmp_path / "talks.jsonl").write_text('["S1"]\n')
+    assert run(tmp_path, str(tmp_path / "talks.jsonl"), "--jsonl")[0] == 2
+    assert "expected an options dictionary" in capsys.readouterr().err
+    assert run(tmp_path, str(tmp_path / "missing.json"))[0] == 2
+
+
+def test_failed_images_exit_with_status_one(make_generator, tmp_path, capsys):
+    (tmp_path / "talks.json").write_text(json.dumps([talk(0), {"file_name": "S1", "elements": {"image": [{}]}}]))
+    assert run(tmp_path, str(tmp_path / "talks.json")) == (1, ["S0.png"])
+    assert "Failed to generate S1" in capsys.readouterr().err
@@ -0,0 +1,43 @@
+import functools
+import os
+import threading
+import pytest
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from social_image_generator import Downloader
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def base_url(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "avatar.jpg").write_bytes(os.urandom(256 * 1024))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(served)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_downloads_to_the_same_path(tmp_path, base_url):
+    path = str(tmp_path / "y.jpg")
+    downloader = Downloader()
+    results = downloader.fetch_many([(base_url + "avatar.jpg", path)] * 8)
+    downloader.close()
+    assert [result.error for result in results] == [None] * 8
+    assert (tmp_path / "y.jpg").read_bytes() == (tmp_path / "served" / "avatar.jpg").read_bytes()
+    assert sorted(os.listdir(str(tmp_path))) == ["served", "y.jpg"]
+
+
+def test_failed_downloads_are_reported(tmp_path, base_url):
+    downloader = Downloader()
+    result = downloader.fetch(base_url + "missing.jpg", str(tmp_path / "missing.jpg"))
+    downloader.close()
+    assert not result.ok
+    assert os.listdir(str(tmp_path)) == ["served"]
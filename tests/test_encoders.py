@@ -0,0 +1,90 @@
+import io
+import threading
+import pytest
+from PIL import Image
+from social_image_generator import BackgroundWriter
+from social_image_generator import Encoder
+from .conftest import white_text
+
+
+def gradient():
+    image = Image.new("RGBA", (64, 32))
+    image.putdata([(x * 4, y * 8, 128, 255) for y in range(32) for x in range(64)])
+    return image
+
+
+def decode(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_png_is_quantized_to_the_given_colours():
+    encoder = Encoder(colours=16)
+    image = decode(encoder.encode(gradient()))
+    assert (image.format, image.mode, image.size) == ("PNG", "P", (64, 32))
+    assert len(image.getcolors()) <= 16
+    assert len(decode(Encoder().encode(gradient())).getcolors(maxcolors=4096)) > 16
+
+
+def test_jpeg_and_webp_encoding():
+    jpeg = Encoder(format="jpeg", quality=80)
+    assert (jpeg.extension, jpeg.content_type) == (".jpg", "image/jpeg")
+    image = decode(jpeg.encode(gradient()))
+    assert (image.format, image.mode, image.size) == ("JPEG", "RGB", (64, 32))
+    assert len(Encoder(format="jpeg", quality=20).encode(gradient())) < len(Encoder(format="jpeg", quality=95).encode(gradient()))
+
+    webp = Encoder(format="webp")
+    assert (webp.extension, webp.content_type) == (".webp", "image/webp")
+    assert decode(webp.encode(gradient())).format == "WEBP"
+
+
+def test_unsupported_formats_are_rejected():
+    with pytest.raises(ValueError, match="gif"):
+        Encoder(format="gif")
+
+
+def test_encoder_settings_are_part_of_the_digest(make_generator):
+    options = {"elements": {"text": [white_text("title", 80, 340)]}}
+    digests = set()
+    for encoder in ({}, {"compress_level": 9}, {"format": "jpeg"}, {"format": "jpeg", "quality": 60}):
+        generator = make_generator(encoder=encoder)
+        digests.add(generator.render_digest(generator.compile_layout(options).bind("S0", title="Talk")))
+    assert len(digests) == 4
+
+
+def test_background_writer_blocks_at_max_pending():
+    writer = BackgroundWriter(max_workers=1, max_pending=2)
+    release = threading.Event()
+    submitted = []
+
+    def submit_three():
+        for number in range(3):
+            writer.submit(release.wait)
+            submitted.append(number)
+
+    thread = threading.Thread(target=submit_three)
+    thread.start()
+    thread.join(0.2)
+    assert submitted == [0, 1]
+    release.set()
+    thread.join(5)
+    assert submitted == [0, 1, 2]
+    writer.close()
+
+
+def test_background_writer_flush_raises_job_errors():
+    writer = BackgroundWriter()
+    done = []
+
+    def fail():
+        raise OSError("disk full")
+
+    writer.submit(done.append, 1)
+    writer.submit(fail)
+    with pytest.raises(OSError, match="disk full"):
+        writer.flush()
+    assert done == [1]
+    # Errors are raised once, later flushes only report new ones
+    writer.flush()
+    writer.close()
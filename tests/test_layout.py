@@ -0,0 +1,64 @@
+import pytest
+from PIL import Image
+from social_image_generator import RenderJob
+from .conftest import white_text
+
+
+def circle(x, y, **options):
+    return dict({"position": {"x": x, "y": y}, "dimensions": {"x": 120, "y": 120}, "circle": "True"}, **options)
+
+
+@pytest.mark.parametrize("elements, error", [
+    ({"text": [{"value": "No position"}]}, "Text element has no position"),
+    ({"text": [{"value": "x", "centered": "True", "position": {"x": 80, "y": 10}}]}, "position x of \\[x, x2\\]"),
+    ({"text": [{"value": "x", "centered": True, "position": {"x": [80], "y": 10}}]}, "position x of \\[x, x2\\]"),
+    ({"images": [{"dimensions": {"x": 1, "y": 1}, "circle": "True", "slot": "photo"}]}, "Image element has no position"),
+    ({"images": [{"position": {"x": 1, "y": 1}, "circle": "True", "slot": "photo"}]}, "Image element has no dimensions"),
+    ({"images": [circle(0, 0, circle="False", slot="photo")]}, "Only circle image elements"),
+    ({"images": [dict(circle(0, 0), circle=None, slot="photo")]}, "Only circle image elements"),
+    ({"images": [circle(0, 0)]}, "no image_name or slot"),
+    ({"video": [{}]}, "Unknown element type: video"),
+])
+def test_invalid_layouts_are_rejected(make_generator, elements, error):
+    with pytest.raises(ValueError, match=error):
+        make_generator().compile_layout({"elements": elements})
+
+
+def test_layouts_need_a_template(make_generator):
+    generator = make_generator()
+    generator.template = None
+    with pytest.raises(ValueError, match="no template"):
+        generator.compile_layout({"elements": {}})
+    assert generator.compile_layout({"template": "other.png", "elements": {}}).template == "other.png"
+
+
+def test_bind_checks_the_slots(make_generator):
+    layout = make_generator().compile_layout(
+        {"elements": {"text": [white_text("title", 80, 340), white_text("speaker", 80, 400)],
+                      "images": [circle(900, 100, slot="photo")]}})
+    assert layout.slots == {"title", "speaker", "photo"}
+    with pytest.raises(ValueError, match="Missing values for slots: photo, speaker"):
+        layout.bind("S0", title="Talk")
+    with pytest.raises(ValueError, match="Unknown slots: room"):
+        layout.bind("S0", title="Talk", speaker="Ada", photo="ada.png", room="1")
+    job = layout.bind("S0", title="Talk", speaker="Ada", photo="ada.png")
+    assert job == RenderJob(layout, "S0", {"title": "Talk", "speaker": "Ada", "photo": "ada.png"})
+
+
+def test_compiled_layouts_render_like_options(make_generator, tmp_path):
+    images = tmp_path / "output" / "images"
+    images.mkdir(parents=True)
+    Image.new("RGB", (300, 300), (200, 120, 40)).save(str(images / "ada.png"))
+    generator = make_generator()
+    title = dict(white_text("title", [80, 700], 340, size=40), centered="True")
+    speaker = dict(white_text("speaker", 80, 420), multiline="True", wrap_width=12)
+    values = {"title": "Keynote", "speaker": "Ada Lovelace and Charles Babbage", "photo": "ada.png"}
+    layout = generator.compile_layout({"elements": {"text": [title, speaker], "images": [circle(900, 100, slot="photo")]}})
+
+    # The same layout written out with its values in place of the slots
+    for element, slot in ((title, "title"), (speaker, "speaker")):
+        del element["slot"]
+        element["value"] = values[slot]
+    options = {"file_name": "S0",
+               "elements": {"text": [title, speaker], "images": [circle(900, 100, image_name="ada.png")]}}
+    assert generator.render(layout.bind("S0", **values)).tobytes() == generator.render(options).tobytes()
@@ -0,0 +1,104 @@
+from PIL import Image
+from social_image_generator import MemorySink
+from social_image_generator import RenderManifest
+from social_image_generator import TarSink
+from social_image_generator import inputs_digest
+from .conftest import white_text
+
+
+LAYOUT = {"elements": {"text": [white_text("title", 80, 340)]}}
+
+
+def test_inputs_digest_follows_values_and_file_contents(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("one")
+    digest = inputs_digest({"a": 1}, [str(path)])
+    assert digest == inputs_digest({"a": 1}, [str(path)])
+    assert digest != inputs_digest({"a": 2}, [str(path)])
+    path.write_text("two!")
+    assert digest != inputs_digest({"a": 1}, [str(path)])
+    assert inputs_digest({}, [str(tmp_path / "missing")]) == inputs_digest({}, [str(tmp_path / "missing")])
+
+
+def test_manifest_round_trips(tmp_path):
+    path = str(tmp_path / "output.manifest.json")
+    manifest = RenderManifest(path)
+    manifest.record("a", "1")
+    manifest.meta["shard"] = {"index": 1, "count": 2}
+    manifest.save()
+    loaded = RenderManifest(path)
+    assert loaded.is_current("a", "1") and not loaded.is_current("a", "2")
+    assert loaded.meta == {"shard": {"index": 1, "count": 2}}
+
+
+def test_corrupt_manifests_start_empty(tmp_path):
+    path = tmp_path / "output.manifest.json"
+    path.write_text("{not json")
+    assert RenderManifest(str(path)).entries() == {}
+
+
+def test_incremental_batches_skip_unchanged_images(make_generator, tmp_path):
+    generator = make_generator(incremental=True)
+    layout = generator.compile_layout(LAYOUT)
+    jobs = [layout.bind("S{}".format(number), title="Talk {}".format(number)) for number in range(3)]
+    assert [result.skipped for result in generator.create_images(jobs, workers=1)] == [False] * 3
+
+    generator = make_generator(incremental=True)
+    jobs[1] = layout.bind("S1", title="Renamed")
+    (tmp_path / "output" / "S2.png").unlink()
+    assert [result.skipped for result in generator.create_images(jobs, workers=1)] == [True, False, False]
+    assert [result.skipped for result in generator.create_images(jobs, workers=1, force=True)] == [False] * 3
+
+    # A changed template renders everything again
+    Image.new("RGB", (1200, 675), (0, 0, 0)).save(str(tmp_path / "template.png"))
+    generator = make_generator(incremental=True)
+    assert [result.skipped for result in generator.create_images(jobs, workers=1)] == [False] * 3
+
+
+def test_other_sinks_do_not_touch_the_output_manifest(make_generator, tmp_path):
+    generator = make_generator(incremental=True)
+    layout = generator.compile_layout(LAYOUT)
+    old, new = layout.bind("S0", title="Old"), layout.bind("S0", title="New")
+    generator.create_image(old)
+    assert list(generator.create_images([new], workers=1, sink=MemorySink()))[0].skipped is False
+    with TarSink(str(tmp_path / "images.tar")) as sink:
+        generator.create_image(new, sink=sink)
+    # The directory still holds the old title, so it is rendered again
+    assert [result.skipped for result in generator.create_images([new], workers=1)] == [False]
+    assert [result.skipped for result in generator.create_images([new], workers=1)] == [True]
+
+
+def test_batches_pull_items_as_they_render(make_generator):
+    generator = make_generator(incremental=True, max_in_flight=2)
+    layout = generator.compile_layout(LAYOUT)
+    generator.create_image(layout.bind("S3", title="Talk 3"))
+    pulled = []
+
+    def jobs():
+        for number in range(8):
+            pulled.append(number)
+            if number == 5:
+                yield {"file_name": "S5", "elements": {"image": [{}]}}
+            else:
+                yield layout.bind("S{}".format(number), title="Talk {}".format(number))
+
+    for workers in (1, 2):
+        del pulled[:]
+        results = generator.create_images(jobs(), workers=workers, force=workers == 2)
+        assert next(results).index == 0
+        assert len(pulled) <= 3
+        rest = list(results)
+        assert [result.index for result in rest] == list(range(1, 8))
+        assert rest[2].skipped is (workers == 1)
+        assert rest[4].error is not None
+
+
+def test_single_images_save_the_manifest_on_flush(make_generator, tmp_path):
+    generator = make_generator(incremental=True)
+    layout = generator.compile_layout(LAYOUT)
+    for number in range(3):
+        generator.create_image(layout.bind("S{}".format(number), title="Talk {}".format(number)))
+    path = str(tmp_path / "output.manifest.json")
+    assert RenderManifest(path).entries() == {}
+    generator.flush()
+    assert sorted(RenderManifest(path).entries()) == ["S0", "S1", "S2"]
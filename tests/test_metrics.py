@@ -0,0 +1,53 @@
+from social_image_generator import LRUCache
+from social_image_generator import Metrics
+from social_image_generator import NullMetrics
+from social_image_generator import text_run_cache
+from .conftest import white_text
+
+
+def test_timings_counters_and_hooks():
+    calls = []
+    metrics = Metrics(hooks=[lambda *args: calls.append(args)])
+    metrics.record("render", 0.5)
+    metrics.record("render", 1.5)
+    metrics.incr("images_rendered")
+    summary = metrics.summary()
+    assert summary["timings"]["render"] == {"count": 2, "total_ms": 2000, "mean_ms": 1000, "max_ms": 1500}
+    assert summary["counters"] == {"images_rendered": 1}
+    assert calls == [("timing", "render", 0.5), ("timing", "render", 1.5), ("counter", "images_rendered", 1)]
+
+
+def test_taken_state_merges_with_cache_counters():
+    cache = LRUCache()
+    cache.get("inherited")
+    worker = Metrics()
+    worker.add_cache("font", cache)
+    worker.record("render", 1.0)
+    cache.get_or_create("a", lambda: 1)
+    cache.get_or_create("a", lambda: 1)
+    parent = Metrics()
+    parent.merge(worker.take())
+    cache.get_or_create("a", lambda: 1)
+    parent.merge(worker.take())
+    summary = parent.summary()
+    assert summary["timings"]["render"]["count"] == 1
+    assert summary["caches"]["font"] == {"hits": 2, "misses": 1, "evictions": 0}
+    # Nothing new since the last take
+    assert worker.take() == ({}, {}, {"font": [0, 0, 0]})
+
+
+def test_null_metrics_take_nothing():
+    assert NullMetrics().take() is None
+
+
+def test_worker_cache_stats_reach_the_summary(make_generator):
+    layout_options = {"elements": {"text": [white_text("title", 80, 340)]}}
+    text_run_cache.clear()
+    generator = make_generator(metrics=True)
+    layout = generator.compile_layout(layout_options)
+    jobs = [layout.bind("S{}".format(number), title="Keynote") for number in range(6)]
+    assert all(result.error is None for result in generator.create_images(jobs, workers=2))
+    caches = generator.metrics.summary()["caches"]
+    assert caches["text_run"]["hits"] + caches["text_run"]["misses"] == 6
+    assert caches["text_run"]["hits"] >= 4
+    assert generator.metrics.summary()["counters"]["images_rendered"] == 6
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+import types
+import social_image_generator
+from social_image_generator import get_sched_api_key
+
+
+def test_public_names_are_imported_lazily():
+    code = ("import sys, social_image_generator as package; "
+            "assert 'social_image_generator.core' not in sys.modules; "
+            "package.SocialImageGenerator; "
+            "assert 'requests' not in sys.modules and 'sqlite3' not in sys.modules")
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_every_public_name_resolves():
+    for name in social_image_generator.__all__:
+        assert getattr(social_image_generator, name) is not None
+
+
+def test_sched_api_key_comes_from_the_environment_first(monkeypatch):
+    monkeypatch.setitem(sys.modules, "secrets", types.SimpleNamespace(SCHED_API_KEY="from-secrets"))
+    monkeypatch.setenv("SCHED_API_KEY", "from-env")
+    assert get_sched_api_key() == "from-env"
+    monkeypatch.delenv("SCHED_API_KEY")
+    assert get_sched_api_key() == "from-secrets"
+    monkeypatch.setitem(sys.modules, "secrets", types.SimpleNamespace())
+    assert get_sched_api_key() is None
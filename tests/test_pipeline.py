@@ -0,0 +1,61 @@
+import pytest
+from main import SocialMediaImageAutomation
+from social_image_generator import run_pipeline
+
+
+def double(items):
+    for item in items:
+        yield item * 2
+
+
+def fail_on_three(items):
+    for item in items:
+        if item == 3:
+            raise RuntimeError("bad item")
+        yield item
+
+
+def test_items_flow_through_every_stage_in_order():
+    assert list(run_pipeline(range(50), [double, double], maxsize=2)) == [item * 4 for item in range(50)]
+
+
+def test_stage_errors_reach_the_consumer():
+    results = run_pipeline(range(10), [fail_on_three, double], maxsize=2)
+    assert next(results) == 0
+    with pytest.raises(RuntimeError, match="bad item"):
+        list(results)
+
+
+def test_source_errors_reach_the_consumer():
+    def source():
+        yield 1
+        raise ValueError("bad source")
+
+    with pytest.raises(ValueError, match="bad source"):
+        list(run_pipeline(source(), [double]))
+
+
+def make_automation(prepared):
+    automation = SocialMediaImageAutomation.__new__(SocialMediaImageAutomation)
+    automation.speaker_batch_size = 16
+    automation.pipeline_queue_size = 4
+    automation.download_speaker_images = prepared.extend
+    automation.get_speaker_bios = lambda speakers: None
+    return automation
+
+
+def test_prepare_speakers_flushes_sessions_of_repeat_speakers():
+    prepared = []
+    automation = make_automation(prepared)
+    consumed = []
+
+    def sessions():
+        for number in range(500):
+            consumed.append(number)
+            yield {"name": str(number)}, ("S{}".format(number), ""), [{"username": "one", "name": "One"}]
+
+    results = automation.prepare_speakers(sessions())
+    next(results)
+    assert len(consumed) == automation.pipeline_queue_size
+    assert len(list(results)) == 499
+    assert prepared == [{"username": "one", "name": "One"}]
@@ -0,0 +1,41 @@
+from PIL import Image
+from social_image_generator.presets import PRESETS
+from social_image_generator.presets import Preset
+from social_image_generator.presets import preset_images
+
+
+def test_preset_images_yields_every_preset_and_width():
+    composite = Image.new("RGB", (1200, 675), (255, 0, 0))
+    names = {name: image.size for name, image, format in preset_images(composite, PRESETS.values())}
+    assert names["facebook"] == (1200, 630)
+    assert names["pinterest"] == (1000, 1500)
+    assert names["opengraph-600w"] == (600, 315)
+    assert names["opengraph-300w"] == (300, 158)
+
+
+def test_preset_images_widths_survive_closing_the_preset_image():
+    composite = Image.new("RGB", (1200, 675))
+    preset = Preset("og", (1200, 630), 0.9, "png", (600,))
+    for name, image, format in preset_images(composite, [preset]):
+        image.close()
+
+
+def test_create_preset_images_writes_all_presets(make_generator):
+    generator = make_generator()
+    options = {
+        "file_name": "x",
+        "elements": {
+            "text": [
+                {"value": "Keynote", "position": {"x": 80, "y": 340},
+                 "font": {"size": 48, "family": "fonts/Lato-Bold.ttf", "colour": {"r": 255, "g": 255, "b": 255}}}
+            ]
+        }
+    }
+    written = generator.create_preset_images(options)
+    assert set(written) == {"facebook", "twitter", "linkedin", "pinterest", "opengraph",
+                            "opengraph-600w", "opengraph-300w"}
+    for name, path in written.items():
+        with Image.open(path) as image:
+            assert image.width in (1200, 1000, 600, 300)
+    with Image.open(written["opengraph-600w"]) as image:
+        assert image.size == (600, 315)
@@ -0,0 +1,56 @@
+from main import SocialMediaImageAutomation
+from social_image_generator import UserDirectory
+from social_image_generator import read_sched_sessions
+from social_image_generator import read_sessions
+from social_image_generator import read_users
+
+
+def write_csv(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8-sig")
+    return str(path)
+
+
+def test_header_columns_are_found_by_name(tmp_path):
+    path = write_csv(tmp_path, "sessions.csv",
+                     "Session_ID,Tracks,Title,Speakers\nSAN19-100,Kernel,Boot faster,\"Ann Lee, Bob\"\n")
+    assert list(read_sessions(path)) == [{"title": "Boot faster", "blurb": "", "session_id": "SAN19-100",
+                                          "speakers": "Ann Lee, Bob", "tracks": "Kernel"}]
+
+
+def test_headerless_files_are_read_by_column_index(tmp_path):
+    row = ["c{}".format(index) for index in range(17)]
+    path = write_csv(tmp_path, "users.csv", ",".join(row) + "\n" + ",".join(row[:5]) + "\n")
+    users = list(read_users(path))
+    assert users[0]["speaker_email"] == "c12"
+    assert users[0]["first_name"] == "c2"
+    assert users[1]["first_name"] == "c2"
+    assert users[1]["photo_url"] == ""
+
+
+def test_empty_files_have_no_records(tmp_path):
+    assert list(read_sessions(write_csv(tmp_path, "sessions.csv", ""))) == []
+
+
+def test_csv_sessions_feed_the_session_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = write_csv(tmp_path, "sessions.csv",
+                     "Session ID,Title,Description,Tracks,Speakers\n"
+                     "SAN19-100,Boot faster,Less waiting,\"Kernel, Boot\",Ann Lee\n"
+                     "SAN19-101,Lunch,,Food & Beverage,\n")
+    automation = SocialMediaImageAutomation.__new__(SocialMediaImageAutomation)
+    automation.shard = None
+    automation.speaker_batch_size = 16
+    automation.pipeline_queue_size = 4
+    automation.connect_code = "san19"
+    automation.download_speaker_images = lambda speakers: None
+    automation.get_speaker_bios = lambda speakers: None
+    automation.users = UserDirectory([{"username": "ann", "name": "Ann Lee", "company": "Arm", "position": "",
+                                       "location": "", "image": "ann.jpg", "bio": ""}])
+    sessions = list(automation.session_pipeline(read_sched_sessions(path)))
+    assert len(sessions) == 1
+    assert sessions[0]["session_id"] == "SAN19-100"
+    assert sessions[0]["title"] == "Boot faster"
+    assert sessions[0]["session_track"] == "Kernel"
+    assert sessions[0]["description"] == "Less waiting"
+    assert [speaker["speaker_name"] for speaker in sessions[0]["session_speakers"]] == ["Ann Lee"]
@@ -0,0 +1,66 @@
+import threading
+import pytest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from PIL import Image
+from social_image_generator import RenderService
+from social_image_generator import make_server
+from .conftest import white_text
+
+
+LAYOUT = {
+    "elements": {
+        "images": [{"dimensions": {"x": 100, "y": 100}, "position": {"x": 10, "y": 10}, "slot": "speaker_image",
+                    "circle": "True"}],
+        "text": [white_text("title", 80, 340)]
+    }
+}
+
+
+@pytest.fixture
+def service(make_generator, tmp_path):
+    generator = make_generator()
+    (tmp_path / "output" / "images").mkdir(parents=True)
+    Image.new("RGB", (200, 200), (0, 255, 0)).save(str(tmp_path / "output" / "images" / "speaker.jpg"))
+    Image.new("RGB", (200, 200), (255, 0, 0)).save(str(tmp_path / "secret.jpg"))
+    sessions = {"S1": {"speaker_image": "speaker.jpg", "title": "Keynote"}}
+    return RenderService(generator, generator.compile_layout(LAYOUT), lookup=sessions.get)
+
+
+@pytest.fixture
+def base_url(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_only_text_slots_are_overridable(service):
+    assert service.overridable == {"title"}
+    job = service.job("S1", {"title": "Changed", "speaker_image": "../../secret.jpg"})
+    assert job.values == {"speaker_image": "speaker.jpg", "title": "Changed"}
+
+
+def test_image_paths_cannot_leave_the_output_directory(service):
+    for name in ("../secret.jpg", "a/b.jpg", "a\\b.jpg"):
+        with pytest.raises(ValueError):
+            service.generator._image_path("images/", name)
+
+
+def test_serves_cached_images_with_etags(base_url, service):
+    with urlopen(base_url + "S1.png?title=Hello") as response:
+        assert response.headers["Content-Type"] == "image/png"
+        etag = response.headers["ETag"]
+        first = response.read()
+    with urlopen(base_url + "S1.png?title=Hello&speaker_image=..%2F..%2Fsecret.jpg") as response:
+        assert response.headers["ETag"] == etag
+        assert response.read() == first
+    assert len(service.cache) == 1
+
+
+def test_unknown_images_are_not_found(base_url):
+    with pytest.raises(HTTPError) as error:
+        urlopen(base_url + "S2.png")
+    assert error.value.code == 404
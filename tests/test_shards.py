@@ -0,0 +1,73 @@
+import json
+import pytest
+from social_image_generator import RenderManifest
+from social_image_generator import in_shard
+from social_image_generator import merge_shard_manifests
+from social_image_generator import parse_shard
+from social_image_generator import record_assigned
+from social_image_generator import shard_index
+from social_image_generator import shard_manifest_path
+
+
+NAMES = ["SAN19-{}".format(number) for number in range(200)]
+
+
+def write_shards(manifest_path, count, names=NAMES, skip=()):
+    """Writes the manifest each shard would, leaving out the names in skip"""
+    for index in range(1, count + 1):
+        manifest = RenderManifest(shard_manifest_path(manifest_path, (index, count)))
+        assigned = [name for name in names if in_shard(name, (index, count))]
+        record_assigned(manifest, (index, count), assigned)
+        for name in assigned:
+            if name not in skip:
+                manifest.record(name, "digest-" + name)
+        manifest.save()
+
+
+def test_parse_shard():
+    assert parse_shard("2/3") == (2, 3)
+    for shard in ("0/3", "4/3", "1/0", "1", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def test_shards_partition_the_names():
+    owners = [[index for index in range(1, 5) if in_shard(name, (index, 4))] for name in NAMES]
+    assert all(len(owner) == 1 for owner in owners)
+    assert {owner[0] for owner in owners} == {1, 2, 3, 4}
+    assert all(shard_index(name, 4) == owner[0] for name, owner in zip(NAMES, owners))
+    assert all(in_shard(name, None) for name in NAMES)
+
+
+def test_shard_manifest_path():
+    assert shard_manifest_path("out/output.manifest.json", (2, 3)) == "out/output.shard-2-of-3.manifest.json"
+
+
+def test_merge_complete_shards(tmp_path):
+    manifest_path = str(tmp_path / "output.manifest.json")
+    write_shards(manifest_path, 3)
+    assert merge_shard_manifests(manifest_path, 3, NAMES) == []
+    with open(manifest_path) as f:
+        assert len(json.load(f)["entries"]) == len(NAMES)
+
+
+def test_merge_reports_gaps(tmp_path):
+    manifest_path = str(tmp_path / "output.manifest.json")
+    write_shards(manifest_path, 3, skip=["SAN19-7"])
+    problems = merge_shard_manifests(manifest_path, 3, NAMES + ["EXTRA"])
+    assert problems == ["SAN19-7 was not rendered by shard {}/3".format(shard_index("SAN19-7", 3)),
+                        "EXTRA was not assigned to any shard"]
+
+
+def test_merge_reports_missing_and_overlapping_shards(tmp_path):
+    manifest_path = str(tmp_path / "output.manifest.json")
+    write_shards(manifest_path, 2)
+    # Also hand a name owned by shard 1 to shard 2
+    name = next(name for name in NAMES if shard_index(name, 2) == 1)
+    manifest = RenderManifest(shard_manifest_path(manifest_path, (2, 2)))
+    record_assigned(manifest, (2, 2), manifest.meta["assigned"] + [name])
+    manifest.record(name, "digest")
+    manifest.save()
+    assert merge_shard_manifests(manifest_path, 2) == ["{} was assigned to shards 1 and 2".format(name)]
+    (tmp_path / "output.shard-1-of-2.manifest.json").unlink()
+    assert merge_shard_manifests(manifest_path, 2)[0].startswith("Shard 1/2 wrote no manifest")
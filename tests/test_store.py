@@ -0,0 +1,45 @@
+from main import SocialMediaImageAutomation
+from social_image_generator import SchedStore
+
+
+def make_store(tmp_path, count=600):
+    store = SchedStore(str(tmp_path / "sched.sqlite"))
+    store.update_sessions({"id": "s{:04}".format(number), "name": "SAN19-{} Talk".format(number + 100)}
+                          for number in range(count))
+    return store
+
+
+def test_sessions_are_read_in_pages(tmp_path):
+    store = make_store(tmp_path)
+    sessions = store.sessions()
+    assert next(sessions)["id"] == "s0000"
+    assert len(list(sessions)) == 599
+
+
+def test_inactive_sessions_are_deleted(tmp_path):
+    store = make_store(tmp_path, 3)
+    store.update_sessions([{"id": "s0001", "active": "N"}, {"id": "s0002", "name": "Renamed"}])
+    assert [session.get("name") for session in store.sessions()] == ["SAN19-100 Talk", "Renamed"]
+
+
+def test_last_sync_is_recorded_per_resource(tmp_path):
+    store = make_store(tmp_path, 0)
+    assert store.last_sync("sessions") is None
+    store.mark_synced("sessions", 1234)
+    assert store.last_sync("sessions") == 1234
+    assert store.last_sync("users") is None
+
+
+def test_users_are_found_by_name(tmp_path):
+    store = make_store(tmp_path, 0)
+    store.update_users([{"username": "ann", "name": "Ann"}])
+    assert store.user("ann") == {"username": "ann", "name": "Ann"}
+    assert store.missing_user_names(["Ann", "Bob"]) == {"Bob"}
+
+
+def test_merge_shards_reads_sessions_from_the_store(tmp_path):
+    automation = SocialMediaImageAutomation.__new__(SocialMediaImageAutomation)
+    automation.store = make_store(tmp_path, 5)
+    automation.manifest_path = str(tmp_path / "output.manifest.json")
+    assert not automation.merge_shards(2)
+    assert (tmp_path / "output.manifest.json").exists()
@@ -0,0 +1,34 @@
+import pytest
+from PIL import Image
+from PIL import ImageDraw
+from social_image_generator import draw_text_run
+from social_image_generator import get_font
+from social_image_generator import layout_text
+from social_image_generator import text_run
+from .conftest import ASSETS_PATH
+
+
+FONT = ASSETS_PATH + "/fonts/Lato-Bold.ttf"
+
+
+@pytest.mark.parametrize("text", ["TBC", "jumpy Quay, gj", "Keynote: Arm & Linux", "", " ", "Hello\nWorld"])
+@pytest.mark.parametrize("xy", [(80, 340), (920.5, 400), (3.25, 0.75)])
+def test_text_runs_match_draw_text(text, xy):
+    expected = Image.new("RGBA", (1200, 500), (10, 20, 30, 255))
+    actual = expected.copy()
+    ImageDraw.Draw(expected).text(xy, text, (255, 200, 100), font=get_font(FONT, 28))
+    draw_text_run(ImageDraw.Draw(actual), xy, text, FONT, 28, (255, 200, 100))
+    assert actual.tobytes() == expected.tobytes()
+
+
+def test_text_runs_are_cached_by_subpixel_origin():
+    assert text_run("Keynote", FONT, 30, (10, 10)) is text_run("Keynote", FONT, 30, (500, 20))
+    assert text_run("Keynote", FONT, 30, (10, 10)) is not text_run("Keynote", FONT, 30, (10.5, 10))
+
+
+def test_layout_text_wraps_and_centers():
+    lines = layout_text("one two three four", FONT, 28, wrap_width=9, centered=True, multiline=True,
+                        box_width=50)
+    assert [line for x, y, line in lines] == ["one two", "three", "four"]
+    assert lines[0][1] == 0 and lines[1][1] > 0
+    assert all(x < 50 for x, y, line in lines)
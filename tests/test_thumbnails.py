@@ -0,0 +1,138 @@
+import os
+import shutil
+import pytest
+from PIL import Image
+from PIL import ImageOps
+from social_image_generator import thumbnails
+from social_image_generator.thumbnails import circle_mask
+from social_image_generator.thumbnails import circle_thumbnail
+from social_image_generator.thumbnails import load_fitted
+from social_image_generator.thumbnails import normalized_avatar
+from social_image_generator.thumbnails import thumbnail_cache
+
+
+def halves(size, left, right):
+    """Returns an RGB image with its left half in one colour and its right half in another"""
+    image = Image.new("RGB", size, left)
+    image.paste(right, (size[0] // 2, 0, size[0], size[1]))
+    return image
+
+
+def test_large_jpegs_are_decoded_at_a_reduced_scale(tmp_path, monkeypatch):
+    path = str(tmp_path / "large.jpg")
+    halves((2000, 1600), (255, 0, 0), (0, 0, 255)).save(path, format="jpeg")
+    decoded = []
+    exif_transpose = ImageOps.exif_transpose
+
+    def record_decoded_size(image):
+        decoded.append(image.size)
+        return exif_transpose(image)
+
+    monkeypatch.setattr(ImageOps, "exif_transpose", record_decoded_size)
+    fitted = load_fitted(path, (200, 200))
+    assert decoded == [(250, 200)]
+    assert (fitted.mode, fitted.size) == ("RGBA", (200, 200))
+    # Small targets of other formats are decoded in full
+    path = str(tmp_path / "large.png")
+    halves((400, 320), (255, 0, 0), (0, 0, 255)).save(path, format="png")
+    load_fitted(path, (50, 40))
+    assert decoded[1] == (400, 320)
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    # Stored on its side: orientation 6 is displayed turned a quarter clockwise,
+    # bringing the stored left half to the top
+    path = str(tmp_path / "rotated.jpg")
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    halves((800, 400), (255, 0, 0), (0, 0, 255)).save(path, format="jpeg", exif=exif.tobytes())
+    fitted = load_fitted(path, (100, 200))
+    assert fitted.size == (100, 200)
+    top, bottom = fitted.getpixel((50, 20)), fitted.getpixel((50, 180))
+    assert top[0] > 200 and top[2] < 50
+    assert bottom[2] > 200 and bottom[0] < 50
+
+
+def test_normalized_avatars_are_written_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "avatar.jpg")
+    halves((600, 600), (255, 0, 0), (0, 0, 255)).save(path, format="jpeg")
+    directory = str(tmp_path / "normalized")
+    loads = []
+
+    def counting_load_fitted(file_name, dimensions):
+        loads.append(file_name)
+        return load_fitted(file_name, dimensions)
+
+    monkeypatch.setattr(thumbnails, "load_fitted", counting_load_fitted)
+    normalized = normalized_avatar(path, (120, 120), directory)
+    assert normalized_avatar(path, (120.0, 120), directory + "/") == normalized
+    assert loads == [path]
+    with Image.open(normalized) as image:
+        assert image.size == (120, 120)
+    assert os.listdir(directory) == [os.path.basename(normalized)]
+
+    # New content or dimensions get their own copy
+    halves((600, 600), (0, 255, 0), (0, 0, 255)).save(path, format="jpeg")
+    assert normalized_avatar(path, (120, 120), directory) != normalized
+    assert normalized_avatar(path, (60, 60), directory).endswith("-60x60.png")
+    assert len(loads) == 3
+
+
+@pytest.fixture
+def crops(monkeypatch):
+    """Starts from an empty thumbnail cache and records each source that is cropped"""
+    thumbnail_cache.clear()
+    crops = []
+
+    def counting_load_fitted(file_name, dimensions):
+        crops.append((os.path.basename(file_name), dimensions))
+        return load_fitted(file_name, dimensions)
+
+    monkeypatch.setattr(thumbnails, "load_fitted", counting_load_fitted)
+    yield crops
+    thumbnail_cache.clear()
+
+
+def test_circle_masks_are_shared():
+    mask = circle_mask((80.0, 60))
+    assert mask is circle_mask((80, 60))
+    assert (mask.mode, mask.size) == ("L", (80, 60))
+    assert mask.getpixel((0, 0)) == 0 and mask.getpixel((40, 30)) == 255
+
+
+def test_circle_thumbnails_are_cropped_once_per_content_and_size(tmp_path, crops):
+    path = str(tmp_path / "one.png")
+    halves((300, 300), (255, 0, 0), (0, 0, 255)).save(path)
+    shutil.copyfile(path, str(tmp_path / "copy.png"))
+    thumbnail = circle_thumbnail(path, (100, 100))
+    assert circle_thumbnail(path, (100, 100)) is thumbnail
+    # Another file with the same content shares the thumbnail
+    assert circle_thumbnail(str(tmp_path / "copy.png"), (100, 100)) is thumbnail
+    assert crops == [("one.png", (100, 100))]
+    assert thumbnail.getpixel((0, 0))[3] == 0 and thumbnail.getpixel((50, 50))[3] == 255
+    circle_thumbnail(path, (50, 50))
+    assert crops[1:] == [("one.png", (50, 50))]
+
+
+def test_changed_sources_get_a_new_circle_thumbnail(tmp_path, crops):
+    path = str(tmp_path / "one.png")
+    Image.new("RGB", (200, 200), (255, 0, 0)).save(path)
+    assert circle_thumbnail(path, (100, 100)).getpixel((50, 50)) == (255, 0, 0, 255)
+    Image.new("RGB", (240, 240), (0, 255, 0)).save(path)
+    assert circle_thumbnail(path, (100, 100)).getpixel((50, 50)) == (0, 255, 0, 255)
+    assert len(crops) == 2
+
+
+def test_circle_thumbnails_are_saved_only_when_asked(make_generator, tmp_path, crops):
+    images = tmp_path / "output" / "images"
+    images.mkdir(parents=True)
+    Image.new("RGB", (200, 200), (255, 0, 0)).save(str(images / "speaker.png"))
+    generator = make_generator()
+    generator.create_circle_thumbnail("images/", "speaker.png", (100, 100), "thumbnails/")
+    assert not (tmp_path / "output" / "thumbnails").exists()
+
+    generator = make_generator(save_thumbnails=True)
+    thumbnail = generator.create_circle_thumbnail("images/", "speaker.png", (100, 100), "thumbnails/")
+    with Image.open(str(tmp_path / "output" / "thumbnails" / "speaker.png-circle.png")) as saved:
+        assert saved.tobytes() == thumbnail.tobytes()
+    assert len(crops) == 1
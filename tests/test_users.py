@@ -0,0 +1,48 @@
+from social_image_generator import UserDirectory
+from social_image_generator import normalize_name
+
+
+def test_normalize_name():
+    assert normalize_name("José  O'Neil") == "jose oneil"
+
+
+def test_users_are_found_by_every_key():
+    users = UserDirectory([{"username": "jo", "name": "José O'Neil", "email": "Jo@Example.com"}])
+    for key in ("jo", "jo@example.com", "José O'Neil", "jose oneil", "JOSE O'NEIL"):
+        assert users.get(key)["username"] == "jo"
+    assert users.get("nobody") is None
+    assert "jo" in users and len(users) == 1
+
+
+def test_merging_fills_empty_fields_and_replaces_listed_ones():
+    users = UserDirectory()
+    users.add({"username": "ann", "name": "Ann", "bio": "", "company": "Arm", "location": "Cambridge"})
+    users.add({"username": "ann", "name": "Ann Lee", "bio": "Hacker", "company": "Linaro", "location": ""})
+    assert list(users) == [{"username": "ann", "name": "Ann", "bio": "Hacker", "company": "Linaro",
+                            "location": "Cambridge"}]
+
+
+def test_users_without_a_username_merge_by_email_then_name():
+    users = UserDirectory()
+    users.add({"name": "Bob", "email": "bob@example.com"})
+    users.add({"name": "Robert", "email": "BOB@example.com", "avatar": "bob.jpg"})
+    users.add({"name": "Bob", "position": "Engineer"})
+    assert len(users) == 1
+    assert users["Bob"]["avatar"] == "bob.jpg"
+    assert users["Bob"]["position"] == "Engineer"
+
+
+def test_shared_names_prefer_filled_fields_then_lowest_username():
+    first = [{"username": "zed", "name": "Sam", "avatar": "zed.jpg"},
+             {"username": "amy", "name": "Sam", "avatar": ""},
+             {"username": "bea", "name": "Sam", "avatar": "bea.jpg"}]
+    for users in (UserDirectory(first), UserDirectory(reversed(first))):
+        assert users["Sam"]["username"] == "bea"
+        assert users["sam"]["username"] == "bea"
+
+
+def test_resolve_reports_missing_names():
+    users = UserDirectory([{"username": "ann", "name": "Ann Lee"}])
+    found, missing = users.resolve("Ann Lee, Nobody, ")
+    assert [user["username"] for user in found] == ["ann"]
+    assert missing == ["Nobody"]